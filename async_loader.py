@@ -0,0 +1,230 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import asyncpg
+from config_paths import config, is_enabled
+from db_connect import connection_params
+from embedding_cache import get_default_cache
+from model_registry import encode
+from vector_io import encode_vector, decode_vector
+import metrics
+
+# asyncio variant of loader.generate_embeddings on asyncpg (LOAD_ASYNC=1). Fetching,
+# encoding and writing are three tasks joined by bounded queues: while one batch is
+# encoded in a worker thread, the next is fetched and the previous one is written,
+# so the stage takes about as long as encoding alone.
+DEFAULT_BATCH_SIZE = 128
+DEFAULT_COMMIT_EVERY = 10
+# Batches allowed to wait between two stages; bounds memory to a few batches
+QUEUE_DEPTH = 2
+
+_DONE = object()
+
+# asyncpg equivalents of db_connect.connection_params
+def connect_kwargs():
+    params = connection_params()
+    kwargs = {
+        "host": params["host"],
+        "port": int(params["port"]) if params["port"] else None,
+        "user": params["user"],
+        "password": params["password"],
+        "database": params["dbname"]
+    }
+    settings = {}
+    if config.get("db_statement_timeout"):
+        settings["statement_timeout"] = config["db_statement_timeout"]
+    if config.get("db_idle_in_transaction_timeout"):
+        settings["idle_in_transaction_session_timeout"] = config["db_idle_in_transaction_timeout"]
+    if settings:
+        kwargs["server_settings"] = settings
+    if "connect_timeout" in params:
+        kwargs["timeout"] = params["connect_timeout"]
+    return kwargs
+
+async def connect():
+    return await asyncpg.connect(**connect_kwargs())
+
+# Sends and receives pgvector values in their binary form, as float32 arrays
+async def register_vector(conn):
+    schema = await conn.fetchval("""
+        SELECT n.nspname FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace
+        WHERE t.typname = 'vector'
+    """)
+    await conn.set_type_codec(
+        "vector", schema=schema, encoder=encode_vector, decoder=decode_vector, format="binary"
+    )
+
+# Adds the embedding column if needed and returns (id column, id type), or None when
+# the table has no description column
+async def prepare_table(conn, table_name):
+    columns = [row[0] for row in await conn.fetch("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name = $1
+        ORDER BY ordinal_position
+    """, table_name.lower())]
+    if 'description' not in columns:
+        logging.error("Required column 'description' not found.")
+        return None
+    if 'embedding' not in columns:
+        logging.info("Adding 'embedding' column to table...")
+        await conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN embedding vector(768)')
+
+    id_col = 'sysdocid' if 'sysdocid' in columns else columns[0]
+    id_type = await conn.fetchval("""
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = $1::regclass AND attname = $2
+    """, f'"{table_name}"', id_col)
+    return id_col, id_type
+
+# Pages the rows missing an embedding through a server-side cursor and queues them as
+# encode batches; the last batch of each page is flagged, since pages are the commit unit
+async def fetch_batches(conn, table_name, id_col, batch_size, commit_every, sort_by_length, queue):
+    page_size = batch_size * commit_every
+    async with conn.transaction():
+        cursor = await conn.cursor(
+            f'SELECT "{id_col}"::text, description FROM "{table_name}" WHERE embedding IS NULL'
+        )
+        while True:
+            rows = await cursor.fetch(page_size)
+            if not rows:
+                break
+            if sort_by_length:
+                rows.sort(key=lambda row: len(row[1] or ""))
+            for offset in range(0, len(rows), batch_size):
+                await queue.put((rows[offset:offset + batch_size], offset + batch_size >= len(rows)))
+    await queue.put(_DONE)
+
+# Encodes each batch on the executor thread; a failed batch is passed on without
+# vectors so the writer can drop its page
+async def encode_batches(executor, batch_size, in_queue, out_queue, stats):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await in_queue.get()
+        if item is _DONE:
+            break
+        rows, last = item
+        start = time.perf_counter()
+        try:
+            vecs = await loop.run_in_executor(executor, encode, [row[1] or "" for row in rows], batch_size)
+        except Exception as e:
+            logging.error(f"Failed to encode a batch of {len(rows)} rows: {e}")
+            vecs = None
+        stats["encode_seconds"] += time.perf_counter() - start
+        await out_queue.put((rows, vecs, last))
+    await out_queue.put(_DONE)
+
+# Binary-COPYs each batch into the staging table and applies it with one UPDATE;
+# every page is one transaction, rolled back as a whole if any of its batches fails
+async def write_batches(conn, table_name, id_col, id_type, queue, stats):
+    transaction = None
+    page_rows = 0
+    page_failed = False
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            break
+        rows, vecs, last = item
+        page_rows += len(rows)
+
+        if not page_failed:
+            try:
+                if vecs is None:
+                    raise ValueError("batch could not be encoded")
+                if transaction is None:
+                    transaction = conn.transaction()
+                    await transaction.start()
+                await conn.execute("TRUNCATE embedding_stage")
+                await conn.copy_records_to_table(
+                    "embedding_stage", records=[(row[0], vec) for row, vec in zip(rows, vecs)],
+                    columns=["id", "embedding"]
+                )
+                await conn.execute(f"""
+                    UPDATE "{table_name}" AS t
+                    SET embedding = s.embedding
+                    FROM embedding_stage AS s
+                    WHERE t."{id_col}" = s.id::{id_type}
+                """)
+            except Exception as e:
+                # The page keeps a NULL embedding and is picked up by the next run
+                logging.error(f"Failed to update embeddings for a page: {e}")
+                page_failed = True
+                if transaction is not None:
+                    await transaction.rollback()
+                    transaction = None
+
+        if last:
+            if page_failed:
+                stats["failed"] += page_rows
+            else:
+                await transaction.commit()
+                transaction = None
+                stats["rows"] += page_rows
+                elapsed = time.perf_counter() - stats["start"]
+                logging.info(f"Committed {stats['rows']} embeddings ({stats['rows'] / max(elapsed, 1e-9):.0f} rows/sec)")
+            page_rows = 0
+            page_failed = False
+
+async def generate_embeddings_async(table_name, batch_size=None, commit_every=None):
+    batch_size = int(batch_size or config.get("embed_batch_size") or DEFAULT_BATCH_SIZE)
+    commit_every = int(commit_every or config.get("embed_commit_every") or DEFAULT_COMMIT_EVERY)
+    sort_by_length = config.get("embed_sort_by_length") is None or is_enabled(config.get("embed_sort_by_length"))
+
+    # The server-side cursor needs its own connection, as in the blocking loader
+    write_conn = await connect()
+    read_conn = None
+    # One encode thread: the model and the SQLite embedding cache see one call at a time
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+    stats = {"rows": 0, "failed": 0, "encode_seconds": 0.0, "start": time.perf_counter()}
+    try:
+        prepared = await prepare_table(write_conn, table_name)
+        if prepared is None:
+            return stats
+        id_col, id_type = prepared
+        await register_vector(write_conn)
+        await write_conn.execute("CREATE TEMP TABLE IF NOT EXISTS embedding_stage (id text, embedding vector)")
+        read_conn = await connect()
+
+        fetched = asyncio.Queue(QUEUE_DEPTH)
+        encoded = asyncio.Queue(QUEUE_DEPTH)
+        tasks = [
+            asyncio.create_task(fetch_batches(read_conn, table_name, id_col, batch_size, commit_every, sort_by_length, fetched)),
+            asyncio.create_task(encode_batches(executor, batch_size, fetched, encoded, stats)),
+            asyncio.create_task(write_batches(write_conn, table_name, id_col, id_type, encoded, stats))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # A stage that dies would leave the others blocked on their queues
+            for task in tasks:
+                task.cancel()
+            raise
+
+        if not stats["rows"] and not stats["failed"]:
+            logging.info("No rows found that need embeddings.")
+            return stats
+
+        elapsed = time.perf_counter() - stats["start"]
+        if stats["failed"]:
+            logging.warning(f"{stats['failed']} rows were not embedded and will be retried on the next run.")
+        logging.info(
+            f"Updated {stats['rows']} embeddings in {elapsed:.1f}s, {stats['encode_seconds']:.1f}s of it encoding "
+            f"({stats['rows'] / max(elapsed, 1e-9):.0f} rows/sec)."
+        )
+        cache = get_default_cache()
+        if cache is not None:
+            logging.info(f"Embedding cache: {cache.stats()}")
+        return stats
+    finally:
+        executor.shutdown(wait=True)
+        if read_conn is not None:
+            await read_conn.close()
+        await write_conn.close()
+
+# Blocking entry point used by loader.run_post_load_steps
+def generate_embeddings(table_name, batch_size=None, commit_every=None):
+    with metrics.stage("embeddings") as stage:
+        stats = asyncio.run(generate_embeddings_async(table_name, batch_size, commit_every))
+        stage.rows += stats["rows"]
+    return stats
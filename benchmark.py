@@ -0,0 +1,648 @@
+import os
+import sys
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import tempfile
+import time
+import datetime
+import numpy as np
+import pandas as pd
+from config_paths import config
+from transformation import compile_plan, transform_data
+from frame_io import write_frame, read_frame
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s:%(message)s'
+)
+
+# Mapping shaped like etl_config.csv after transformation.load_config:
+# (Source FieldName, Target FieldName, Target DataType, Target Default Value)
+ETL_FIELDS = [
+    ("datadescription", "Description", "string", ""),
+    ("sourcedocumentid", "SysDocID", "int", ""),
+    ("filename", "FileName", "string", "unknown.pdf"),
+    ("title", "Title", "string", ""),
+    ("qcscandate", "QCScanDate", "date", ""),
+    ("cmodloaddate", "LoadDate", "date", ""),
+    ("scandate", "ScanDate", "date", ""),
+    ("documentid", "DocumentID", "string", ""),
+    ("batchreferenceid", "BatchReferenceID", "int", "0"),
+]
+
+DESCRIPTION_PHRASES = [
+    "Invoice from Vendor A for the July 2023 billing period.",
+    "Each item has been verified for price accuracy and quantity.",
+    "The scan passed OCR quality checks and has been tagged for indexing.",
+    "Receipt for office supplies purchased by Facilities Team.",
+    "Shipping manifest outlining pallets of mixed merchandise.",
+    "The report summarizes defect rates, compliance percentages and corrective actions.",
+    "Packing list detailing all items included in the dispatch.",
+    "File includes electronic signature and reference barcode.",
+]
+
+def synthetic_config():
+    return pd.DataFrame(
+        ETL_FIELDS,
+        columns=["Source FieldName", "Target FieldName", "Target DataType", "Target Default Value"]
+    )
+
+# Builds an extracted frame with etl_data's columns; descriptions are drawn from a
+# small pool of long texts so multi-million-row frames stay cheap to hold
+def synthetic_extract(rows, seed=0, null_fraction=0.01):
+    rng = np.random.default_rng(seed)
+    pool = np.array([
+        " ".join(rng.choice(DESCRIPTION_PHRASES, size=12)) for _ in range(256)
+    ], dtype=object)
+
+    def dates():
+        days = pd.to_timedelta(rng.integers(0, 365, rows), unit="D")
+        return (pd.Timestamp("2023-01-01") + days).strftime("%Y-%m-%d").to_numpy(dtype=object)
+
+    df = pd.DataFrame({
+        "datadescription": pool[rng.integers(0, len(pool), rows)],
+        "sourcedocumentid": np.arange(1001, 1001 + rows),
+        "filename": np.char.add("doc_", np.arange(rows).astype(str)).astype(object),
+        "title": np.char.add("Title ", np.arange(rows).astype(str)).astype(object),
+        "qcscandate": dates(),
+        "cmodloaddate": dates(),
+        "scandate": dates(),
+        "documentid": np.char.add("DOC", np.arange(rows).astype(str)).astype(object),
+        "batchreferenceid": rng.integers(500, 600, rows).astype(float),
+    })
+
+    # Sprinkle missing values so the default fills have work to do
+    for col in ("filename", "batchreferenceid"):
+        df.loc[rng.random(rows) < null_fraction, col] = np.nan
+    return df
+
+# Returns the best wall time of `repeat` calls
+def time_call(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_transform(rows, date_format="%Y-%m-%d", repeat=3):
+    config_df = synthetic_config()
+    df = synthetic_extract(rows)
+    plan = compile_plan(config_df, date_format)
+
+    seconds = time_call(lambda: transform_data(df, config_df, plan), repeat)
+    return {
+        "stage": "transform",
+        "rows": rows,
+        "date_format": date_format,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds)
+    }
+
+# Compares CSV and Parquet as the intermediate format: write time, full parse,
+# a two-column projected read, and size on disk
+def bench_formats(rows, repeat=3):
+    df = synthetic_extract(rows)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("csv", "parquet"):
+            path = os.path.join(tmp, f"extracted.{fmt}")
+            write_seconds = time_call(lambda: write_frame(df, path), 1)
+            read_seconds = time_call(lambda: read_frame(path), repeat)
+            projected_seconds = time_call(lambda: read_frame(path, ["sourcedocumentid", "scandate"]), repeat)
+            results.append({
+                "stage": "formats",
+                "format": fmt,
+                "rows": rows,
+                "write_seconds": round(write_seconds, 4),
+                "read_seconds": round(read_seconds, 4),
+                "projected_read_seconds": round(projected_seconds, 4),
+                "size_mb": round(os.path.getsize(path) / 1e6, 2)
+            })
+    return results
+
+# Cold-start time and RSS of the shared embedding model, then warm encode throughput.
+# Backend, device and threads come from the EMBED_* settings, so runs can be compared.
+def bench_model(rows, batch_size=64, repeat=3):
+    from model_registry import get_model, get_load_stats, MODEL_NAME
+
+    model = get_model()
+    texts = synthetic_extract(rows)["datadescription"].tolist()
+    seconds = time_call(lambda: model.encode(texts, batch_size=batch_size, normalize_embeddings=True), repeat)
+    return {
+        "stage": "model",
+        "model": MODEL_NAME,
+        "cold_start": get_load_stats()[MODEL_NAME],
+        "rows": rows,
+        "batch_size": batch_size,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1)
+    }
+
+# Encode throughput through the process pool at 1, 2, 4, ... workers up to max_workers.
+# Each worker is pinned to cpu_count // workers threads; the first call per pool
+# (model load in every worker) is excluded from the timing.
+def bench_workers(rows, max_workers=None, batch_size=64, repeat=3):
+    from model_registry import PooledEncoder, MODEL_NAME
+
+    max_workers = max_workers or os.cpu_count() or 1
+    texts = synthetic_extract(rows)["datadescription"].tolist()
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+
+    results = []
+    baseline = None
+    for workers in counts:
+        encoder = PooledEncoder(MODEL_NAME, workers)
+        encoder.encode(texts[:batch_size * workers], batch_size=batch_size)
+        seconds = time_call(lambda: encoder.encode(texts, batch_size=batch_size), repeat)
+        baseline = baseline or seconds
+        results.append({
+            "stage": "workers",
+            "workers": workers,
+            "threads_per_worker": encoder.threads,
+            "rows": rows,
+            "batch_size": batch_size,
+            "seconds": round(seconds, 4),
+            "rows_per_sec": round(rows / seconds, 1),
+            "speedup": round(baseline / seconds, 2)
+        })
+    return results
+
+# Clustered unit vectors, closer to real embeddings than uniform noise
+def synthetic_vectors(rows, dim=768, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vecs = centers[rng.integers(0, clusters, rows)] + 0.5 * rng.standard_normal((rows, dim)).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+# Recall@k and per-query latency of each book index type against the exact flat index
+def bench_ann(rows, dim=768, queries=200, k=10, index_types=None):
+    from bookembeddings import IndexBuilder, set_search_params
+
+    # Queries are held-out draws from the same clusters as the indexed vectors
+    vecs = synthetic_vectors(rows + queries, dim)
+    vecs, query_vecs = vecs[:rows], vecs[rows:]
+    ids = [str(i) for i in range(rows)]
+
+    results = []
+    truth = None
+    for kind in index_types or ["flat", "hnsw", "ivf", "ivfpq"]:
+        builder = IndexBuilder(kind)
+        start = time.perf_counter()
+        builder.add(ids, vecs)
+        index = builder.finish()
+        build_seconds = time.perf_counter() - start
+        set_search_params(index)
+
+        start = time.perf_counter()
+        found = np.vstack([index.search(query_vecs[i:i + 1], k)[1] for i in range(queries)])
+        search_seconds = time.perf_counter() - start
+        if truth is None:
+            truth = found
+        recall = recall_at_k(found, truth)
+
+        results.append({
+            "stage": "ann",
+            "index": kind,
+            "rows": rows,
+            "k": k,
+            "build_seconds": round(build_seconds, 3),
+            "query_ms": round(1000 * search_seconds / queries, 3),
+            f"recall_at_{k}": round(recall, 4)
+        })
+    return results
+
+def recall_at_k(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / max(len(t), 1) for f, t in zip(found, truth)]))
+
+# pgvector HNSW / IVFFlat latency and recall@k against an exact scan, on synthetic
+# vectors binary-COPYed into a temp table of the configured database
+def bench_pgvector(rows, dim=768, queries=100, k=10):
+    import vector_search
+    from db_connect import get_connection, release_connection
+    from vector_io import copy_payload
+
+    vecs = synthetic_vectors(rows + queries, dim)
+    vecs, query_vecs = vecs[:rows], vecs[rows:]
+    table = "bench_vectors"
+
+    def run(conn, **params):
+        start = time.perf_counter()
+        found = [
+            [hit["id"] for hit in vector_search.search_many(
+                q[None, :], k, table_name=table, id_col="id", conn=conn, **params)[0]]
+            for q in query_vecs
+        ]
+        conn.rollback()
+        return found, 1000 * (time.perf_counter() - start) / queries
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute(f"CREATE TEMP TABLE {table} (id integer, embedding vector({dim}))")
+            cur.copy_expert(
+                f"COPY {table} (id, embedding) FROM STDIN WITH (FORMAT binary)",
+                copy_payload([range(rows), vecs], ["int4", "vector"])
+            )
+        conn.commit()
+
+        with conn.cursor() as cur:
+            cur.execute("SET enable_indexscan = off")
+        truth, exact_ms = run(conn)
+        with conn.cursor() as cur:
+            cur.execute("RESET enable_indexscan")
+        conn.commit()
+        results = [{"stage": "pgvector", "index": "exact", "rows": rows, "k": k, "query_ms": round(exact_ms, 3)}]
+
+        for method, param, values in (("hnsw", "ef_search", (10, 40, 100, 200)),
+                                      ("ivfflat", "probes", (1, 5, 10, 20))):
+            start = time.perf_counter()
+            vector_search.create_index(conn, table, method=method)
+            build_seconds = time.perf_counter() - start
+            for value in values:
+                found, query_ms = run(conn, **{param: value})
+                results.append({
+                    "stage": "pgvector",
+                    "index": method,
+                    param: value,
+                    "rows": rows,
+                    "k": k,
+                    "build_seconds": round(build_seconds, 3),
+                    "query_ms": round(query_ms, 3),
+                    f"recall_at_{k}": round(recall_at_k(found, truth), 4)
+                })
+        return results
+    finally:
+        release_connection(conn)
+
+# Streams rows' worth of transformed frames through loader.copy_frames_into_table.
+# Offline, the cursor only drains the COPY buffers, which measures the client side
+# (CSV serialization); with live=True they go to a temp table in the configured database.
+# Transformed synthetic rows ready for COPY. The transform fills missing ids with the
+# text default, leaving object columns of floats such as 574.0 that COPY rejects for
+# bigint, so the int columns are cast back to (nullable) integers.
+def load_frame(rows):
+    config_df = synthetic_config()
+    plan = compile_plan(config_df, "%Y-%m-%d")
+    df = transform_data(synthetic_extract(rows), config_df, plan)
+    ints = [target for _, target, dtype, _ in ETL_FIELDS if dtype == "int"]
+    return df.astype({col: "float64" for col in ints}).astype({col: "Int64" for col in ints})
+
+# Columns of the live bench_load table, typed as the ETL config declares them
+def load_table_ddl():
+    types = {"string": "text", "int": "bigint", "date": "date"}
+    return ", ".join(f'"{target.lower()}" {types[dtype]}' for _, target, dtype, _ in ETL_FIELDS)
+
+def bench_load(rows, repeat=3, live=False, batch_size=50000):
+    from loader import copy_frames_into_table
+
+    df = load_frame(rows)
+    columns = [col.lower() for col in df.columns]
+    frames = [df.iloc[i:i + batch_size] for i in range(0, rows, batch_size)]
+
+    conn = None
+    if live:
+        from db_connect import get_connection
+        conn = get_connection()
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE bench_load ({load_table_ddl()})")
+    cursor = conn.cursor() if live else DiscardCursor()
+
+    def load():
+        if live:
+            cursor.execute("TRUNCATE bench_load")
+        copy_frames_into_table(cursor, frames, "bench_load", columns)
+        if live:
+            conn.commit()
+
+    try:
+        nbytes = sum(len(frame.to_csv(index=False).encode("utf-8")) for frame in frames)
+        seconds = time_call(load, repeat)
+    finally:
+        if conn is not None:
+            from db_connect import release_connection
+            release_connection(conn)
+    return {
+        "stage": "load",
+        "mode": "live" if live else "client",
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds),
+        "mb_per_sec": round(nbytes / 1e6 / seconds, 1)
+    }
+
+# Stands in for a psycopg2 cursor: reads each COPY buffer to the end and drops it
+class DiscardCursor:
+    def copy_expert(self, sql, f):
+        while f.read(1 << 20):
+            pass
+
+# Minimal PDF with a real text layer: `pages` letter pages of description lines,
+# written by hand (no PDF library) so pdfplumber exercises its normal path
+def synthetic_pdf(path, pages, lines_per_page=40, seed=0):
+    rng = np.random.default_rng(seed)
+    font_id = 3 + 2 * pages
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(pages))}] /Count {pages} >>"
+    ]
+    for i in range(pages):
+        lines = [str(rng.choice(DESCRIPTION_PHRASES)) for _ in range(lines_per_page)]
+        lines[0] = f"Invoice book page {i + 1}"
+        text = " T* ".join(
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj" for line in lines
+        )
+        stream = f"BT /F1 10 Tf 14 TL 50 760 Td {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin1")
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+# Page extraction from a synthetic PDF (cold, then served from the page cache) and
+# chunking of the extracted text
+def bench_chunking(pages, repeat=3):
+    from bookembeddings import iter_page_records, iter_chunks
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = synthetic_pdf(os.path.join(tmp, "book.pdf"), pages)
+        cold = []
+
+        def extract_cold():
+            cache_dir = tempfile.mkdtemp(dir=tmp)
+            cold[:] = [(r["page"], r["text"]) for r in iter_page_records(pdf_path, workers=1, cache_dir=cache_dir)]
+        cold_seconds = time_call(extract_cold, repeat)
+
+        cache_dir = os.path.join(tmp, "warm")
+        list(iter_page_records(pdf_path, workers=1, cache_dir=cache_dir))
+        warm_seconds = time_call(lambda: list(iter_page_records(pdf_path, workers=1, cache_dir=cache_dir)), repeat)
+
+        chunks = []
+
+        def chunk():
+            chunks[:] = iter_chunks(cold)
+        chunk_seconds = time_call(chunk, repeat)
+
+    return {
+        "stage": "chunking",
+        "pages": pages,
+        "chunks": len(chunks),
+        "extract_seconds": round(cold_seconds, 4),
+        "cached_extract_seconds": round(warm_seconds, 4),
+        "chunk_seconds": round(chunk_seconds, 4),
+        "pages_per_sec": round(pages / cold_seconds, 1),
+        "chunks_per_sec": round(len(chunks) / chunk_seconds)
+    }
+
+# Switches the shared model to the hashing stub (EMBED_BACKEND=stub) so the embedding
+# path - batching, cache, metrics - is measured without the model's own cost
+def use_stub_model():
+    os.environ["EMBED_BACKEND"] = "stub"
+    config["embed_backend"] = "stub"
+
+# model_registry.encode over one distinct description per row with the stub model:
+# without the cache, with an empty cache and with a warm one
+def bench_embedding(rows, batch_size=128, repeat=3):
+    import embedding_cache
+    from model_registry import get_model, MODEL_NAME
+
+    use_stub_model()
+    model = get_model()
+    texts = [f"{text} Reference DOC{i}." for i, text in enumerate(synthetic_extract(rows)["datadescription"])]
+
+    def encode_all(cache):
+        for offset in range(0, rows, batch_size):
+            embedding_cache.encode_with_cache(model, MODEL_NAME, texts[offset:offset + batch_size], batch_size, cache)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("off", "cold", "warm"):
+            if mode == "off":
+                seconds = time_call(lambda: encode_all(None), repeat)
+            elif mode == "cold":
+                def cold():
+                    cache = embedding_cache.EmbeddingCache(os.path.join(tmp, f"cold_{time.perf_counter_ns()}.sqlite"))
+                    try:
+                        encode_all(cache)
+                    finally:
+                        cache.close()
+                seconds = time_call(cold, repeat)
+            else:
+                cache = embedding_cache.EmbeddingCache(os.path.join(tmp, "warm.sqlite"))
+                encode_all(cache)
+                seconds = time_call(lambda: encode_all(cache), repeat)
+                cache.close()
+            results.append({
+                "stage": "embedding",
+                "cache": mode,
+                "rows": rows,
+                "batch_size": batch_size,
+                "seconds": round(seconds, 4),
+                "rows_per_sec": round(rows / seconds, 1)
+            })
+    return results
+
+# End-to-end generate_book_embeddings on a synthetic PDF with the stub model, broken
+# down by the metrics stages (ocr, encode, build_index)
+def bench_book(pages, index_type="flat"):
+    import metrics
+    from bookembeddings import generate_book_embeddings
+
+    use_stub_model()
+    config["book_index_type"] = index_type
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = synthetic_pdf(os.path.join(tmp, "book.pdf"), pages)
+        config["ocr_cache_dir"] = os.path.join(tmp, "ocr_cache")
+        config["embed_cache"] = "0"
+        metrics.reset()
+        start = time.perf_counter()
+        rows, _ = generate_book_embeddings(
+            pdf_path, os.path.join(tmp, "book_embeddings.csv"), return_df=False,
+            index_path=os.path.join(tmp, "book_index.faiss")
+        )
+        seconds = time.perf_counter() - start
+
+    stages = {s["stage"]: s for s in metrics.report()["stages"]}
+    return {
+        "stage": "book",
+        "pages": pages,
+        "chunks": rows,
+        "index": index_type,
+        "seconds": round(seconds, 4),
+        "ocr_seconds": stages["ocr"]["seconds"],
+        "encode_seconds": stages["encode"]["seconds"],
+        "build_index_self_seconds": stages["build_index"]["self_seconds"],
+        "chunks_per_sec": round(rows / seconds, 1)
+    }
+
+# Commit of this checkout and whether tracked files differ from it
+def git_commit():
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=repo, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo, capture_output=True, text=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+# One line of the results file: the results plus what is needed to compare runs
+def run_record(stage, args, results):
+    commit, dirty = git_commit()
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "dirty": dirty,
+        "stage": stage,
+        "args": args,
+        "host": platform.node(),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            key: value for key, value in config.items()
+            if value and key.startswith(("embed_", "ocr_", "book_index_", "vector_", "transform_", "load_"))
+        },
+        "results": results
+    }
+
+def append_record(path, record):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+# Fields that identify a result (so the same measurement is matched across runs);
+# every other numeric field is a measurement
+KEY_FIELDS = ("stage", "rows", "pages", "format", "mode", "cache", "index", "workers",
+              "batch_size", "date_format", "ef_search", "probes", "k")
+
+def result_key(result):
+    return tuple((field, result[field]) for field in KEY_FIELDS if field in result)
+
+# Pairs up the results of two run records and reports each measurement's change
+def compare_records(old, new):
+    old_results = {result_key(r): r for r in old["results"]}
+    rows = []
+    for result in new["results"]:
+        before = old_results.get(result_key(result))
+        if before is None:
+            continue
+        for field, value in result.items():
+            if field in KEY_FIELDS or not isinstance(value, (int, float)) or not isinstance(before.get(field), (int, float)):
+                continue
+            rows.append({
+                "key": dict(result_key(result)),
+                "field": field,
+                "old": before[field],
+                "new": value,
+                "change": round((value - before[field]) / before[field], 4) if before[field] else None
+            })
+    return rows
+
+def load_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+STAGES = ["transform", "formats", "load", "chunking", "embedding", "book",
+          "model", "workers", "ann", "pgvector", "suite", "compare"]
+# Offline stages run by `suite`; none needs a database or a model download
+SUITE_STAGES = ("transform", "formats", "load", "chunking", "embedding", "book")
+# The embedding stage holds every text and encodes it three times per cache mode, so
+# larger scales are clamped to this many rows
+EMBEDDING_MAX_ROWS = 100000
+DEFAULT_RESULTS = "benchmark_results.jsonl"
+
+def run_stage(stage, args, rows):
+    if stage == "transform":
+        return [bench_transform(rows, args.date_format or None, args.repeat)]
+    if stage == "formats":
+        return bench_formats(rows, args.repeat)
+    if stage == "load":
+        return [bench_load(rows, args.repeat, args.live)]
+    if stage == "chunking":
+        return [bench_chunking(args.pages, args.repeat)]
+    if stage == "embedding":
+        return bench_embedding(rows, repeat=args.repeat)
+    if stage == "book":
+        return [bench_book(args.pages)]
+    if stage == "model":
+        return [bench_model(rows, repeat=args.repeat)]
+    if stage == "workers":
+        return bench_workers(rows, args.max_workers, repeat=args.repeat)
+    if stage == "ann":
+        return bench_ann(rows)
+    return bench_pgvector(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="ETL stage benchmarks")
+    parser.add_argument("stage", choices=STAGES)
+    parser.add_argument("--rows", default="2000000",
+                        help="row count, or a comma-separated list of scales, e.g. 1000,100000,1000000")
+    parser.add_argument("--pages", type=int, default=50, help="synthetic PDF pages for chunking / book")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--date-format", default="%Y-%m-%d")
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--live", action="store_true", help="load into the configured database")
+    parser.add_argument("--output", default=None,
+                        help="append the run (results, git commit, settings) to this JSON-lines file; "
+                             f"compare reads it (default {DEFAULT_RESULTS})")
+    args = parser.parse_args()
+
+    if args.stage == "compare":
+        # The latest run against the previous run of the same stage
+        records = load_records(args.output or DEFAULT_RESULTS)
+        new = records[-1]
+        older = [r for r in records[:-1] if r["stage"] == new["stage"]]
+        if not older:
+            raise SystemExit("Need at least two runs of the same stage to compare.")
+        for row in compare_records(older[-1], new):
+            print(json.dumps(row))
+        return
+
+    scales = [int(value) for value in args.rows.split(",")]
+    stages = SUITE_STAGES if args.stage == "suite" else (args.stage,)
+    results = []
+    for stage in stages:
+        stage_scales = scales
+        if stage == "embedding" and max(scales) > EMBEDDING_MAX_ROWS:
+            logging.info(f"Capping the embedding stage at {EMBEDDING_MAX_ROWS} rows.")
+            stage_scales = sorted({min(rows, EMBEDDING_MAX_ROWS) for rows in scales})
+        for rows in stage_scales:
+            logging.info(f"Benchmarking {stage} on {rows} rows...")
+            for result in run_stage(stage, args, rows):
+                print(json.dumps(result))
+                results.append(result)
+            if stage in ("chunking", "book"):
+                # Sized by --pages, not --rows
+                break
+
+    if args.output:
+        append_record(args.output, run_record(args.stage, vars(args), results))
+        logging.info(f"Results appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,192 @@
 import os
+import json
+import time
 import uuid
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
 import pandas as pd
 import pytesseract
 import pdfplumber
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from config_paths import config
+from model_registry import encode
+from frame_io import tee_batches
+from vector_io import NpyWriter, ids_path
+import metrics
 
-MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 200
 BOOK_PATH = "invoice_book.pdf"
 OUTPUT_CSV = "book_embeddings.csv"
+ENCODE_BATCH_SIZE = 64
+# Chunk rows go to the output CSV/Parquet; their vectors go, in the same row order,
+# to a float32 .npy beside it (book_embeddings.npy), never as text
+BOOK_COLUMNS = ["id", "page", "chunk_idx", "text"]
 
-model = SentenceTransformer(MODEL_NAME)
+# FAISS index over the chunk vectors (inner product = cosine on normalized embeddings),
+# saved next to a .ids.npy file mapping index positions back to chunk ids.
+# BOOK_INDEX_TYPE: flat (exact), hnsw, ivf, or ivfpq (compressed, for very large books).
+BOOK_INDEX_PATH = "book_index.faiss"
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+DEFAULT_NLIST = 1024
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+HNSW_M = 32
+# k-means wants ~39 training points per centroid; PQ codebooks need 256
+TRAIN_POINTS_PER_LIST = 39
+PQ_MIN_TRAIN = 256
 
-def extract_text_with_ocr(pdf_path):
-    pages = []
+# Render resolution for pages without a text layer, by OCR_QUALITY tier;
+# OCR_DPI overrides the tier with an exact value
+OCR_DPI_TIERS = {"draft": 150, "standard": 300, "high": 400}
+DEFAULT_OCR_CACHE_DIR = "ocr_cache"
+OCR_PAGES_PER_TASK = 8
+SLOWEST_PAGES_LOGGED = 5
+
+def get_ocr_dpi():
+    if config.get("ocr_dpi"):
+        return int(config["ocr_dpi"])
+    quality = (config.get("ocr_quality") or "standard").lower()
+    if quality not in OCR_DPI_TIERS:
+        raise ValueError(f"Unknown OCR_QUALITY '{quality}', expected one of {sorted(OCR_DPI_TIERS)}")
+    return OCR_DPI_TIERS[quality]
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# One JSON file per page under <cache_dir>/<pdf sha256>/, so an edited PDF never
+# reuses stale text and a different DPI is OCR'd again
+def page_cache_path(cache_dir, pdf_hash, page_no, dpi):
+    return os.path.join(cache_dir, pdf_hash, f"{page_no:05d}-{dpi}.json")
+
+def read_cached_page(path):
+    with open(path) as f:
+        record = json.load(f)
+    record["cached"] = True
+    return record
+
+def write_cached_page(path, record):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+def _init_ocr_worker():
+    # tesseract's own OpenMP threads would oversubscribe the worker processes
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+# Extracts a run of pages with one open of the PDF; runs inside an OCR worker
+def extract_page_range(pdf_path, page_numbers, dpi):
+    records = []
     with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
+        for page_no in page_numbers:
+            start = time.perf_counter()
+            page = pdf.pages[page_no - 1]
             text = page.extract_text()
+            method = "text"
             if not text or len(text.strip()) == 0:
-                img = page.to_image(resolution=300).original
+                img = page.to_image(resolution=dpi).original
                 text = pytesseract.image_to_string(img)
-            pages.append(text or "")
-    return pages
+                method = "ocr"
+            # Drop pdfplumber's cached layout objects so a long run stays flat in memory
+            page.close()
+            records.append({
+                "page": page_no,
+                "text": text or "",
+                "method": method,
+                "seconds": round(time.perf_counter() - start, 3)
+            })
+    return records
+
+# Like Executor.map, but keeps at most `window` tasks in flight so finished pages
+# cannot pile up in memory ahead of a slower consumer
+def ordered_results(pool, fn, tasks, window):
+    futures = deque()
+    for args in tasks:
+        futures.append(pool.submit(fn, *args))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+# Yields one record per page, in page order: {"page", "text", "method", "seconds", "cached"}.
+# Cached pages are read back from disk; the rest are extracted OCR_WORKERS processes
+# at a time in runs of OCR_PAGES_PER_TASK pages and written to the cache as they finish.
+def iter_page_records(pdf_path, dpi=None, workers=None, cache_dir=None):
+    dpi = dpi or get_ocr_dpi()
+    workers = workers or int(config.get("ocr_workers") or os.cpu_count() or 1)
+    cache_dir = cache_dir or config.get("ocr_cache_dir") or DEFAULT_OCR_CACHE_DIR
+    pdf_hash = file_sha256(pdf_path)
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+
+    cache_paths = {n: page_cache_path(cache_dir, pdf_hash, n, dpi) for n in range(1, page_count + 1)}
+    todo = [n for n, path in cache_paths.items() if not os.path.exists(path)]
+    tasks = [todo[i:i + OCR_PAGES_PER_TASK] for i in range(0, len(todo), OCR_PAGES_PER_TASK)]
+    logging.info(f"{pdf_path}: {page_count} pages, {page_count - len(todo)} cached, {len(todo)} to extract at {dpi} DPI.")
+
+    pool = None
+    task_args = [(pdf_path, pages, dpi) for pages in tasks]
+    if workers > 1 and len(tasks) > 1:
+        workers = min(workers, len(tasks))
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker
+        )
+        results = ordered_results(pool, extract_page_range, task_args, workers * 2)
+    else:
+        results = (extract_page_range(*args) for args in task_args)
+
+    try:
+        pending = {}
+        uncached = set(todo)
+        for page_no in range(1, page_count + 1):
+            if page_no not in uncached:
+                yield read_cached_page(cache_paths[page_no])
+                continue
+            # Tasks come back in submission order, i.e. ascending page order
+            while page_no not in pending:
+                for record in next(results):
+                    write_cached_page(cache_paths[record["page"]], record)
+                    pending[record["page"]] = dict(record, cached=False)
+            yield pending.pop(page_no)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def log_page_stats(records):
+    extracted = [r for r in records if not r["cached"]]
+    ocr_pages = sum(1 for r in extracted if r["method"] == "ocr")
+    total = sum(r["seconds"] for r in extracted)
+    logging.info(
+        f"Pages: {len(records)} total, {len(records) - len(extracted)} from cache, "
+        f"{ocr_pages} OCR'd; {total:.1f}s of page work."
+    )
+    slowest = sorted(extracted, key=lambda r: r["seconds"], reverse=True)[:SLOWEST_PAGES_LOGGED]
+    if slowest:
+        logging.info("Slowest pages: " + ", ".join(f"{r['page']} ({r['method']}, {r['seconds']}s)" for r in slowest))
+
+# (page, text) pairs from the page records; everything but the text is kept in stats
+def page_texts(records, stats):
+    for record in records:
+        stats.append({k: v for k, v in record.items() if k != "text"})
+        yield record["page"], record["text"]
+
+def extract_text_with_ocr(pdf_path):
+    records = list(iter_page_records(pdf_path))
+    log_page_stats(records)
+    return [r["text"] for r in records]
 
 def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     chunks = []
@@ -35,39 +197,206 @@ def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
         start += size - overlap
     return chunks
 
-def build_index(pages_text):
-    data, embeddings = [], []
-
-    for page_i, txt in enumerate(pages_text, start=1):
-        chunks = chunk_text(txt)
-        embs = model.encode(chunks, normalize_embeddings=True)
-
-        for idx, (chunk, emb) in enumerate(zip(chunks, embs)):
-            uid = str(uuid.uuid4())
-            data.append({
-                "id": uid,
-                "page": page_i,
-                "chunk_idx": idx,
-                "text": chunk,
-                "embedding": emb.tolist()
-            })
-            embeddings.append(emb)
-
-    df = pd.DataFrame(data)
-    vecs = np.array(embeddings, dtype="float32")
-    index = faiss.IndexFlatIP(vecs.shape[1])
-    index.add(vecs)
-    return df, index, vecs
-
-def generate_book_embeddings(pdf_path=BOOK_PATH, output_csv=OUTPUT_CSV):
-    pages = extract_text_with_ocr(pdf_path)
-    df, idx, vecs = build_index(pages)
-    
-    # Save to CSV
-    df.to_csv(output_csv, index=False)
-    print(f"Book embeddings saved to {output_csv}")
-    
-    return df
+# (page, chunk_idx, text) for every chunk, pulled lazily from a (page, text) stream
+def iter_chunks(pages):
+    for page_no, text in pages:
+        for idx, chunk in enumerate(chunk_text(text)):
+            yield page_no, idx, chunk
+
+# Groups the chunk stream into batches of batch_size regardless of page boundaries,
+# so every encode call except the last one is full
+def iter_chunk_batches(chunks, batch_size):
+    batch = []
+    for item in chunks:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Encodes one batch at a time and yields (frame, vectors) for it
+def iter_embedded_batches(pages, batch_size=ENCODE_BATCH_SIZE):
+    for batch in iter_chunk_batches(iter_chunks(pages), batch_size):
+        vecs = np.asarray(encode([text for _, _, text in batch], batch_size), dtype="float32")
+        yield pd.DataFrame({
+            "id": [str(uuid.uuid4()) for _ in batch],
+            "page": [page_no for page_no, _, _ in batch],
+            "chunk_idx": [idx for _, idx, _ in batch],
+            "text": [text for _, _, text in batch]
+        }), vecs
+
+# Picks the index_factory string for `kind` given how many training vectors there are,
+# falling back to a smaller or exact index when a book is too small to train one
+def index_spec(kind, dim, n_train, nlist=None):
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{HNSW_M}"
+
+    nlist = min(nlist or DEFAULT_NLIST, n_train // TRAIN_POINTS_PER_LIST)
+    if nlist < 2:
+        logging.info(f"Only {n_train} vectors; using a flat index instead of {kind}.")
+        return "Flat"
+    if kind == "ivfpq" and n_train >= PQ_MIN_TRAIN:
+        # 16-dimensional subvectors: 768 floats become 48 bytes
+        m = max(d for d in range(1, max(1, dim // 16) + 1) if dim % d == 0)
+        return f"IVF{nlist},PQ{m}"
+    return f"IVF{nlist},Flat"
+
+# Builds the index from a stream of batches. IVF variants need training, so vectors are
+# buffered until BOOK_INDEX_TRAIN_SIZE (default nlist * 39) have arrived, then the index
+# is trained on them and later batches are added directly.
+class IndexBuilder:
+    def __init__(self, kind=None, nlist=None, train_size=None):
+        self.kind = (kind or config.get("book_index_type") or "flat").lower()
+        if self.kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown BOOK_INDEX_TYPE '{self.kind}', expected one of {INDEX_TYPES}")
+        self.nlist = nlist or int(config.get("book_index_nlist") or DEFAULT_NLIST)
+        self.train_size = train_size or int(
+            config.get("book_index_train_size") or self.nlist * TRAIN_POINTS_PER_LIST
+        )
+        self.index = None
+        self.ids = []
+        self.pending = []
+        self.pending_rows = 0
+
+    def add(self, ids, vecs):
+        self.ids.extend(ids)
+        if self.index is not None:
+            self.index.add(vecs)
+            return
+        self.pending.append(vecs)
+        self.pending_rows += len(vecs)
+        if self.kind in ("flat", "hnsw") or self.pending_rows >= self.train_size:
+            self.create()
+
+    def create(self):
+        vecs = np.concatenate(self.pending)
+        self.pending = []
+        spec = index_spec(self.kind, vecs.shape[1], len(vecs), self.nlist)
+        self.index = faiss.index_factory(vecs.shape[1], spec, faiss.METRIC_INNER_PRODUCT)
+        if not self.index.is_trained:
+            start = time.perf_counter()
+            self.index.train(vecs)
+            logging.info(f"Trained {spec} index on {len(vecs)} vectors in {time.perf_counter() - start:.1f}s.")
+        self.index.add(vecs)
+
+    def finish(self):
+        if self.index is None and self.pending:
+            self.create()
+        return self.index
+
+def save_index(index, ids, index_path=BOOK_INDEX_PATH):
+    faiss.write_index(index, index_path)
+    np.save(ids_path(index_path), np.array(ids, dtype="U36"))
+    logging.info(f"Saved {index.ntotal}-vector index to {index_path}.")
+
+_indexes = {}
+
+# IO_FLAG_MMAP only maps IVF inverted lists; flat codes (flat indexes and HNSW
+# storage) are mapped with IO_FLAG_MMAP_IFC, which older faiss builds lack. There
+# those indexes are read into RAM.
+def index_read_flags():
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+# Memory-maps the saved index (see index_read_flags) and its id map; nprobe / efSearch
+# come from BOOK_INDEX_NPROBE / BOOK_INDEX_EF_SEARCH and trade recall for latency
+def load_index(index_path=None):
+    index_path = index_path or config.get("book_index_path") or BOOK_INDEX_PATH
+    if index_path not in _indexes:
+        index = faiss.read_index(index_path, index_read_flags())
+        ids = np.load(ids_path(index_path), mmap_mode="r")
+        set_search_params(
+            index,
+            int(config.get("book_index_nprobe") or DEFAULT_NPROBE),
+            int(config.get("book_index_ef_search") or DEFAULT_EF_SEARCH)
+        )
+        _indexes[index_path] = (index, ids)
+    return _indexes[index_path]
+
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+
+# [(chunk_id, score), ...] best first, for each row of vecs
+def search_vectors(index, ids, vecs, k=5):
+    scores, positions = index.search(np.asarray(vecs, dtype="float32"), k)
+    return [
+        [(str(ids[pos]), float(score)) for pos, score in zip(row_pos, row_scores) if pos != -1]
+        for row_pos, row_scores in zip(positions, scores)
+    ]
+
+# Nearest chunks to a query string (or a list of them) in the saved book index
+def search(query, k=5, index_path=None):
+    index, ids = load_index(index_path)
+    queries = [query] if isinstance(query, str) else list(query)
+    results = search_vectors(index, ids, encode(queries, ENCODE_BATCH_SIZE), k)
+    return results[0] if isinstance(query, str) else results
+
+# Identifies the book in book_chunks and on the documents linked to it
+def book_key(pdf_path):
+    return os.path.basename(pdf_path)
+
+def embeddings_path(output_path):
+    return f"{os.path.splitext(output_path)[0]}.npy"
+
+# Streams pages -> chunks -> encode batches into the FAISS index, the output file
+# (CSV or Parquet by extension) and its .npy vectors, one batch at a time.
+# Returns (rows, index, df); df (with an "embedding" column) is only assembled when
+# keep_frames is set, otherwise memory stays flat in the page count.
+@metrics.timed("build_index", rows=lambda result: result[0])
+def build_index(pages, output_path, batch_size=ENCODE_BATCH_SIZE, keep_frames=False, builder=None):
+    builder = builder or IndexBuilder()
+    frames = []
+    writer = None
+
+    def indexed():
+        nonlocal writer
+        for df, vecs in iter_embedded_batches(pages, batch_size):
+            builder.add(df["id"].tolist(), vecs)
+            if writer is None:
+                writer = NpyWriter(embeddings_path(output_path), vecs.shape[1])
+            writer.write(vecs)
+            if keep_frames:
+                frames.append(df.assign(embedding=list(vecs)))
+            yield df
+
+    try:
+        rows = sum(len(df) for df in tee_batches(indexed(), output_path, BOOK_COLUMNS))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    df = None
+    if keep_frames:
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=BOOK_COLUMNS + ["embedding"])
+    return rows, builder.finish(), df
+
+# Returns the chunk frame by default (what the loader stores); with return_df=False
+# nothing is held in memory and (rows, index) is returned instead.
+# The index is saved to BOOK_INDEX_PATH for search().
+def generate_book_embeddings(pdf_path=BOOK_PATH, output_csv=OUTPUT_CSV, return_df=True, index_path=None):
+    index_path = index_path or config.get("book_index_path") or BOOK_INDEX_PATH
+    stats = []
+    builder = IndexBuilder()
+    # OCR time is measured apart from the chunking / encoding that pulls the pages
+    pages = metrics.timed_iter("ocr", page_texts(iter_page_records(pdf_path), stats), rows=lambda page: 1)
+    rows, index, df = build_index(pages, output_csv, keep_frames=return_df, builder=builder)
+    log_page_stats(stats)
+    logging.info(f"Book embeddings saved to {output_csv} ({rows} chunks).")
+
+    if index is not None:
+        save_index(index, builder.ids, index_path)
+        _indexes.pop(index_path, None)
+
+    if return_df:
+        return df
+    return rows, index
 
 if __name__ == "__main__":
     generate_book_embeddings()
@@ -14,5 +14,66 @@ config = {
     "db_pass": os.getenv("DB_PASS"),
     "db_name": os.getenv("DB_NAME"),
     "jdbc_jar_path": os.getenv("JDBC_JAR_PATH"),
-    "db_table": os.getenv("DB_TABLE")
-}
\ No newline at end of file
+    "db_table": os.getenv("DB_TABLE"),
+    "extract_batch_size": os.getenv("EXTRACT_BATCH_SIZE"),
+    "extract_limit": os.getenv("EXTRACT_LIMIT"),
+    "extract_partition_column": os.getenv("EXTRACT_PARTITION_COLUMN"),
+    "extract_partitions": os.getenv("EXTRACT_PARTITIONS"),
+    "extract_workers": os.getenv("EXTRACT_WORKERS"),
+    "extract_predicates": os.getenv("EXTRACT_PREDICATES"),
+    "extract_partition_files": os.getenv("EXTRACT_PARTITION_FILES"),
+    "extract_watermark_column": os.getenv("EXTRACT_WATERMARK_COLUMN"),
+    "extract_state_file": os.getenv("EXTRACT_STATE_FILE"),
+    "load_mode": os.getenv("LOAD_MODE"),
+    "load_key": os.getenv("LOAD_KEY"),
+    "load_async": os.getenv("LOAD_ASYNC"),
+    "export_embedding": os.getenv("EXPORT_EMBEDDING"),
+    "export_gzip_level": os.getenv("EXPORT_GZIP_LEVEL"),
+    "date_format": os.getenv("TRANSFORM_DATE_FORMAT"),
+    "transform_chunk_size": os.getenv("TRANSFORM_CHUNK_SIZE"),
+    "pipeline_checkpoint": os.getenv("PIPELINE_CHECKPOINT"),
+    "embed_batch_size": os.getenv("EMBED_BATCH_SIZE"),
+    "embed_commit_every": os.getenv("EMBED_COMMIT_EVERY"),
+    "embed_sort_by_length": os.getenv("EMBED_SORT_BY_LENGTH"),
+    "embed_cache": os.getenv("EMBED_CACHE"),
+    "embed_cache_path": os.getenv("EMBED_CACHE_PATH"),
+    "embed_cache_max_entries": os.getenv("EMBED_CACHE_MAX_ENTRIES"),
+    "embed_device": os.getenv("EMBED_DEVICE"),
+    "embed_threads": os.getenv("EMBED_THREADS"),
+    "embed_backend": os.getenv("EMBED_BACKEND"),
+    "embed_model_file": os.getenv("EMBED_MODEL_FILE"),
+    "embed_quantize": os.getenv("EMBED_QUANTIZE"),
+    "embed_workers": os.getenv("EMBED_WORKERS"),
+    "embed_worker_threads": os.getenv("EMBED_WORKER_THREADS"),
+    "ocr_workers": os.getenv("OCR_WORKERS"),
+    "ocr_quality": os.getenv("OCR_QUALITY"),
+    "ocr_dpi": os.getenv("OCR_DPI"),
+    "ocr_cache_dir": os.getenv("OCR_CACHE_DIR"),
+    "book_index_path": os.getenv("BOOK_INDEX_PATH"),
+    "book_index_type": os.getenv("BOOK_INDEX_TYPE"),
+    "book_index_nlist": os.getenv("BOOK_INDEX_NLIST"),
+    "book_index_train_size": os.getenv("BOOK_INDEX_TRAIN_SIZE"),
+    "book_index_nprobe": os.getenv("BOOK_INDEX_NPROBE"),
+    "book_index_ef_search": os.getenv("BOOK_INDEX_EF_SEARCH"),
+    "vector_metric": os.getenv("VECTOR_METRIC"),
+    "vector_index_method": os.getenv("VECTOR_INDEX_METHOD"),
+    "vector_index_m": os.getenv("VECTOR_INDEX_M"),
+    "vector_index_ef_construction": os.getenv("VECTOR_INDEX_EF_CONSTRUCTION"),
+    "vector_index_lists": os.getenv("VECTOR_INDEX_LISTS"),
+    "vector_maintenance_work_mem": os.getenv("VECTOR_MAINTENANCE_WORK_MEM"),
+    "vector_ef_search": os.getenv("VECTOR_EF_SEARCH"),
+    "vector_probes": os.getenv("VECTOR_PROBES"),
+    "db_pool_min": os.getenv("DB_POOL_MIN"),
+    "db_pool_max": os.getenv("DB_POOL_MAX"),
+    "db_statement_timeout": os.getenv("DB_STATEMENT_TIMEOUT"),
+    "db_idle_in_transaction_timeout": os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT"),
+    "db_connect_timeout": os.getenv("DB_CONNECT_TIMEOUT"),
+    "db_health_check_after": os.getenv("DB_HEALTH_CHECK_AFTER"),
+    "metrics_report": os.getenv("METRICS_REPORT"),
+    "metrics_textfile": os.getenv("METRICS_TEXTFILE"),
+    "metrics_sample_interval": os.getenv("METRICS_SAMPLE_INTERVAL")
+}
+
+# Interprets an environment flag such as "1", "true" or "yes"
+def is_enabled(value):
+    return str(value or "").strip().lower() in ("1", "true", "yes", "on")
\ No newline at end of file
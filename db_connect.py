@@ -1,6 +1,133 @@
-import sqlalchemy
+import os
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool as pg_pool
+from config_paths import config
 
-def get_connection(cfg):
-    uri = f"postgresql+psycopg2://{cfg['db_user']}:{cfg['db_pass']}@{cfg['db_host']}:{cfg['db_port']}/{cfg['db_name']}"
-    engine = sqlalchemy.create_engine(uri)
-    return engine
+# One process-wide Postgres connection pool shared by loader, vectordb and vector_search,
+# so a pipeline run reuses a handful of sessions instead of reconnecting per step.
+# Borrow with get_connection() / release_connection(conn), or `with pg_connection() as conn`.
+DEFAULT_POOL_MIN = 2
+DEFAULT_POOL_MAX = 8
+# Connections idle longer than this are pinged before being handed out again
+DEFAULT_HEALTH_CHECK_AFTER = 30
+
+_pool = None
+_pool_params = None
+_lock = threading.Lock()
+_borrowed = set()
+_released_at = {}
+
+# psycopg2's pools open minconn sessions up front and close any returned connection
+# beyond minconn idle ones; this one connects on demand but still keeps minconn idle
+class LazyConnectionPool(pg_pool.ThreadedConnectionPool):
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(0, maxconn, *args, **kwargs)
+        self.minconn = minconn
+
+def connection_params():
+    params = {
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "user": os.getenv("DB_USERNAME"),
+        "password": os.getenv("DB_PASSWORD"),
+        "dbname": os.getenv("DB_NAME")
+    }
+    # Server-side limits are only sent when configured, e.g. DB_STATEMENT_TIMEOUT=15min
+    options = []
+    if config.get("db_statement_timeout"):
+        options.append(f"-c statement_timeout={config['db_statement_timeout']}")
+    if config.get("db_idle_in_transaction_timeout"):
+        options.append(f"-c idle_in_transaction_session_timeout={config['db_idle_in_transaction_timeout']}")
+    if options:
+        params["options"] = " ".join(options)
+    if config.get("db_connect_timeout"):
+        params["connect_timeout"] = int(config["db_connect_timeout"])
+    return params
+
+def get_pool():
+    global _pool, _pool_params
+    params = connection_params()
+    with _lock:
+        if _pool is None or _pool.closed or params != _pool_params:
+            if _pool is not None and not _pool.closed:
+                _pool.closeall()
+            _borrowed.clear()
+            _released_at.clear()
+            minconn = int(config.get("db_pool_min") or DEFAULT_POOL_MIN)
+            maxconn = int(config.get("db_pool_max") or DEFAULT_POOL_MAX)
+            _pool = LazyConnectionPool(minconn, maxconn, **params)
+            _pool_params = params
+            logging.info(f"Created Postgres connection pool ({minconn}-{maxconn} connections).")
+        return _pool
+
+def is_healthy(conn):
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_connection():
+    pool = get_pool()
+    conn = pool.getconn()
+    check_after = float(config.get("db_health_check_after") or DEFAULT_HEALTH_CHECK_AFTER)
+    released_at = _released_at.pop(id(conn), None)
+    if released_at is not None and time.monotonic() - released_at > check_after and not is_healthy(conn):
+        # The server or a proxy dropped the idle session; replace it
+        logging.warning("Discarding a broken pooled connection.")
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    _borrowed.add(id(conn))
+    return conn
+
+# Returns a pooled connection (any open transaction is rolled back by the pool);
+# connections that did not come from the pool are simply closed
+def release_connection(conn, close=False):
+    with _lock:
+        pooled = id(conn) in _borrowed
+        _borrowed.discard(id(conn))
+    if not pooled or _pool is None or _pool.closed:
+        conn.close()
+        return
+    _pool.putconn(conn, close=close or bool(conn.closed))
+    if not close and not conn.closed:
+        _released_at[id(conn)] = time.monotonic()
+
+@contextmanager
+def pg_connection():
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+@atexit.register
+def close_pool():
+    global _pool
+    with _lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+# SQLAlchemy engine for pandas.read_sql and similar, with the same settings and
+# pre-ping health checks; sqlalchemy is only imported when this is used
+def get_engine():
+    import sqlalchemy
+    params = connection_params()
+    uri = f"postgresql+psycopg2://{params['user']}:{params['password']}@{params['host']}:{params['port']}/{params['dbname']}"
+    connect_args = {key: params[key] for key in ("options", "connect_timeout") if key in params}
+    return sqlalchemy.create_engine(
+        uri,
+        pool_size=int(config.get("db_pool_max") or DEFAULT_POOL_MAX),
+        pool_pre_ping=True,
+        connect_args=connect_args
+    )
@@ -0,0 +1,150 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import unicodedata
+import numpy as np
+from config_paths import config, is_enabled
+
+# Local SQLite store of embeddings keyed by (model, normalized text hash), so
+# descriptions and book chunks that have been encoded before are never re-encoded
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 1000000
+
+# Keys per SQL statement; stays under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 500
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def text_key(model_key, text):
+    return hashlib.sha256(f"{model_key}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # The async loader encodes on a worker thread; calls are never concurrent
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # Returns {key: vector} for the keys present and marks them as recently used
+    def get_many(self, keys):
+        found = {}
+        now = time.time_ns()
+        for i in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[i:i + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype="float32")
+            if rows:
+                self.conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                    [now] + [key for key, _ in rows]
+                )
+        self.conn.commit()
+        return found
+
+    def put_many(self, model_key, keys, vectors):
+        now = time.time_ns()
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(key, model_key, np.asarray(vec, dtype="float32").tobytes(), now) for key, vec in zip(keys, vectors)]
+        )
+        self.size += self.conn.total_changes - before
+        self.conn.commit()
+        if self.size > self.max_entries:
+            self.evict()
+
+    # Drops the least recently used entries until the cache is back under max_entries
+    def evict(self):
+        excess = self.size - self.max_entries
+        if excess <= 0:
+            return
+        self.conn.execute("""
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+        """, (excess,))
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logging.info(f"Evicted {excess} least recently used embeddings from the cache.")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": self.size
+        }
+
+    def close(self):
+        self.conn.close()
+
+_default_cache = None
+
+# Shared cache configured from EMBED_CACHE / EMBED_CACHE_PATH / EMBED_CACHE_MAX_ENTRIES;
+# returns None when caching is switched off
+def get_default_cache():
+    global _default_cache
+    if config.get("embed_cache") is not None and not is_enabled(config.get("embed_cache")):
+        return None
+    if _default_cache is None:
+        _default_cache = EmbeddingCache(
+            config.get("embed_cache_path") or DEFAULT_CACHE_PATH,
+            int(config.get("embed_cache_max_entries") or DEFAULT_MAX_ENTRIES)
+        )
+    return _default_cache
+
+# model.encode with the cache in front: identical texts in the call are encoded once,
+# texts seen before are served from the cache, and only the rest reach the model
+def encode_with_cache(model, model_name, texts, batch_size, cache=None, normalize_embeddings=True):
+    if cache is None:
+        return model.encode(
+            texts, batch_size=batch_size, normalize_embeddings=normalize_embeddings, convert_to_numpy=True
+        )
+
+    model_key = f"{model_name}:{'normalized' if normalize_embeddings else 'raw'}"
+    keys = [text_key(model_key, text) for text in texts]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    hits = sum(1 for key in keys if key in found)
+    cache.hits += hits
+    cache.misses += len(keys) - hits
+
+    if missing:
+        encoded = model.encode(
+            list(missing.values()), batch_size=batch_size,
+            normalize_embeddings=normalize_embeddings, convert_to_numpy=True
+        )
+        cache.put_many(model_key, list(missing.keys()), encoded)
+        found.update(zip(missing.keys(), np.asarray(encoded, dtype="float32")))
+
+    if not keys:
+        return np.empty((0, 0), dtype="float32")
+    return np.stack([found[key] for key in keys])
@@ -36,3 +36,10 @@ CREATE TABLE etl_embeddings (
 );
 
 SELECT * FROM etl_embeddings;
+
+-- book_chunks, its HNSW index and loader_table.book_key (which links documents to
+-- their book's chunks) are created by loader.load_book_chunks; see
+-- loader.BOOK_CHUNKS_DDL and loader.BOOK_CHUNKS_INDEX_DDL
+
+-- Nearest chunks to a query vector
+-- SELECT page, chunk_idx, text FROM book_chunks ORDER BY embedding <#> '[...]'::vector LIMIT 5;
@@ -0,0 +1,39 @@
+import os
+import json
+import numbers
+import logging
+
+# Small JSON file recording the high-water mark of the last successful extraction,
+# keyed by "<table>.<column>"
+DEFAULT_STATE_FILE = "extract_state.json"
+
+def load_state(path=DEFAULT_STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"Failed to read extraction state from {path}: {e}")
+        raise
+
+def get_watermark(key, path=DEFAULT_STATE_FILE):
+    return load_state(path).get(key)
+
+def save_watermark(key, value, path=DEFAULT_STATE_FILE):
+    if isinstance(value, numbers.Integral):
+        value = int(value)
+    elif isinstance(value, numbers.Real):
+        value = float(value)
+    else:
+        value = str(value)
+
+    state = load_state(path)
+    state[key] = value
+
+    # Write to a temp file first so a crash never leaves a truncated state file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+    logging.info(f"Saved watermark {key} = {value}")
@@ -1,9 +1,14 @@
 import jaydebeapi
 import pandas as pd
 import os
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from csv_utils import update_etl_config
-from config_paths import config
+from config_paths import config, is_enabled
+from extract_state import DEFAULT_STATE_FILE, get_watermark, save_watermark
+from frame_io import write_batches, merge_parts
+import metrics
 
 # Set up logging
 logging.basicConfig(
@@ -11,6 +16,9 @@ logging.basicConfig(
     format='%(asctime)s %(levelname)s:%(message)s'
 )
 
+# Rows pulled per fetchmany call; memory use is bounded by this, not table size
+DEFAULT_BATCH_SIZE = 10000
+
 def load_config(path):
     try:
         df = pd.read_csv(path)
@@ -39,30 +47,184 @@ def get_requested_fields(config_df, limit=9):
         logging.error(f"Error parsing fields from config: {e}")
         raise
 
-def extract_data(fields, config):
-    jdbc_driver = os.getenv("JDBC_DRIVER")
-    jdbc_url = os.getenv("JDBC_URL")
-    username = os.getenv("DB_USERNAME")
-    password = os.getenv("DB_PASSWORD")
-    jar_file = os.getenv("JDBC_JAR_PATH")
-    table_name = os.getenv("DB_TABLE")
+def get_jdbc_connection(fetch_size=DEFAULT_BATCH_SIZE):
+    # defaultRowFetchSize makes the driver page rows from the server instead of
+    # buffering the whole result set inside the JVM (requires autocommit off)
+    conn = jaydebeapi.connect(
+        os.getenv("JDBC_DRIVER"),
+        os.getenv("JDBC_URL"),
+        {
+            "user": os.getenv("DB_USERNAME"),
+            "password": os.getenv("DB_PASSWORD"),
+            "defaultRowFetchSize": str(fetch_size)
+        },
+        os.getenv("JDBC_JAR_PATH")
+    )
+    conn.jconn.setAutoCommit(False)
+    return conn
 
-    # Quote for PostgreSQL case-sensitive fields
+def build_query(fields, table_name, limit=None, where=None, order_by=None):
     field_str = ', '.join([f.lower() for f in fields])
-    logging.info(f"Executing query: SELECT {field_str} FROM {table_name} LIMIT 9")
+    query = f"SELECT {field_str} FROM {table_name}"
+    if where:
+        query += f" WHERE {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return query
+
+# Yields lists of at most batch_size rows until the cursor is exhausted
+def fetch_batches(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+# Streams the source table as DataFrames of at most batch_size rows
+def stream_extract(fields, batch_size=DEFAULT_BATCH_SIZE, limit=None, where=None, order_by=None):
+    query = build_query(fields, os.getenv("DB_TABLE"), limit, where, order_by)
+    logging.info(f"Executing query: {query}")
 
+    conn = None
+    cursor = None
     try:
-        conn = jaydebeapi.connect(jdbc_driver, jdbc_url, [username, password], jar_file)
+        conn = get_jdbc_connection(batch_size)
         cursor = conn.cursor()
-        query = f"SELECT {field_str} FROM {table_name} LIMIT 9"
         cursor.execute(query)
-        rows = cursor.fetchall()
-        df = pd.DataFrame(rows, columns=fields)
-        df.to_csv(config["extracted_path"], index=False)
-        logging.info("Extraction complete.")
+
+        total = 0
+        start = time.perf_counter()
+        for rows in fetch_batches(cursor, batch_size):
+            total += len(rows)
+            elapsed = time.perf_counter() - start
+            logging.info(f"Extracted {total} rows ({total / max(elapsed, 1e-9):.0f} rows/sec)")
+            yield pd.DataFrame(rows, columns=fields)
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except Exception:
+            pass
+
+# ANDs together the non-empty predicates, or returns None when there are none
+def combine_predicates(*predicates):
+    predicates = [p for p in predicates if p]
+    if not predicates:
+        return None
+    return " AND ".join(f"({p})" for p in predicates)
+
+# Inclusive, so rows sharing the last high-water value (a DATE column, say) that
+# landed after the previous run are not lost; the boundary rows are pulled again
+# and LOAD_MODE=merge deduplicates them
+def watermark_predicate(column, value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return f"{column} >= {value}"
+    escaped = str(value).replace("'", "''")
+    return f"{column} >= '{escaped}'"
+
+def watermark_key(column):
+    return f"{os.getenv('DB_TABLE')}.{column}"
+
+# Returns the watermark column and the predicate selecting rows at or after the last run's mark
+def get_incremental_filter(fields, config):
+    column = config.get("extract_watermark_column")
+    if not column:
+        return None, None
+
+    column = column.lower()
+    if column not in [f.lower() for f in fields]:
+        logging.error(f"Watermark column '{column}' is not among the requested fields.")
+        raise ValueError(f"Watermark column '{column}' must be extracted to track its high-water mark")
+
+    state_file = config.get("extract_state_file") or DEFAULT_STATE_FILE
+    last_value = get_watermark(watermark_key(column), state_file)
+    if last_value is None:
+        logging.info(f"No watermark recorded for '{column}'. Running a full extraction.")
+    else:
+        logging.info(f"Extracting rows with {column} >= {last_value}")
+    return column, watermark_predicate(column, last_value)
+
+# Passes batches through while collecting the per-batch maximum of the watermark column
+def track_watermark(batches, column, marks):
+    for df in batches:
+        values = df[column].dropna()
+        if len(values):
+            marks.append(values.max())
+        yield df
+
+def save_incremental_state(column, marks, config):
+    if column and marks:
+        state_file = config.get("extract_state_file") or DEFAULT_STATE_FILE
+        save_watermark(watermark_key(column), max(marks), state_file)
+
+# Returns the watermark column (or None) and the stream of extracted batches.
+# The high-water marks seen are collected in `marks`; pass them to
+# save_incremental_state once the batches have been stored.
+def extract_batches(fields, config, marks):
+    batch_size = int(config.get("extract_batch_size") or DEFAULT_BATCH_SIZE)
+    limit = config.get("extract_limit")
+
+    column, where = get_incremental_filter(fields, config)
+    # A limited pull must take the oldest rows, or the saved high-water mark would
+    # skip past rows that were never extracted
+    order_by = column if column and limit else None
+    batches = metrics.timed_iter("extract", stream_extract(fields, batch_size, limit, where, order_by))
+    if column:
+        batches = track_watermark(batches, column, marks)
+    return column, batches
+
+def extract_data(fields, config, sink=None):
+    try:
+        marks = []
+        column, batches = extract_batches(fields, config, marks)
+
+        if sink is None:
+            total = write_batches(batches, config["extracted_path"], fields)
+            metrics.count("extract", nbytes=os.path.getsize(config["extracted_path"]))
+        else:
+            # Any callable taking a DataFrame batch can act as the sink
+            total = 0
+            for df in batches:
+                sink(df)
+                total += len(df)
+
+        # Only advance the watermark once every batch has been written
+        save_incremental_state(column, marks, config)
+        logging.info(f"Extraction complete. {total} rows extracted.")
     except Exception as e:
         logging.error(f"Extraction failed: {e}")
         raise
+
+# Splits [lo, hi] on an integer key into at most n contiguous range predicates
+def partition_predicates(column, lo, hi, n):
+    if lo is None or hi is None:
+        return [None]
+
+    lo, hi = int(lo), int(hi)
+    n = max(1, min(n, hi - lo + 1))
+    bounds = [lo + (hi - lo + 1) * i // n for i in range(n + 1)]
+    predicates = [f"{column} >= {bounds[i]} AND {column} < {bounds[i + 1]}" for i in range(n)]
+
+    # Rows with a NULL key fall outside every range, so the first partition takes them
+    predicates[0] = f"({predicates[0]}) OR {column} IS NULL"
+    return predicates
+
+def get_key_bounds(column, where=None):
+    query = f"SELECT MIN({column}), MAX({column}) FROM {os.getenv('DB_TABLE')}"
+    if where:
+        query += f" WHERE {where}"
+
+    conn = None
+    cursor = None
+    try:
+        conn = get_jdbc_connection()
+        cursor = conn.cursor()
+        cursor.execute(query)
+        return cursor.fetchone()
     finally:
         try:
             cursor.close()
@@ -70,11 +232,72 @@ def extract_data(fields, config):
         except Exception:
             pass
 
+def partition_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{index:03d}{ext}"
+
+def extract_partition(fields, where, path, batch_size, column=None, marks=None):
+    batches = stream_extract(fields, batch_size, where=where)
+    if column:
+        batches = track_watermark(batches, column, marks)
+    total = write_batches(batches, path, fields)
+    logging.info(f"Partition [{where}] complete: {total} rows.")
+    return total
+
+# Pulls range partitions concurrently, one JDBC connection per worker
+def extract_partitioned(fields, config, predicates=None):
+    batch_size = int(config.get("extract_batch_size") or DEFAULT_BATCH_SIZE)
+    num_partitions = int(config.get("extract_partitions") or 4)
+    workers = int(config.get("extract_workers") or num_partitions)
+
+    try:
+        watermark_column, since = get_incremental_filter(fields, config)
+
+        if predicates is None and config.get("extract_predicates"):
+            predicates = [p.strip() for p in config["extract_predicates"].split(";") if p.strip()]
+        if predicates is None:
+            key = config["extract_partition_column"].lower()
+            lo, hi = get_key_bounds(key, since)
+            predicates = partition_predicates(key, lo, hi, num_partitions)
+
+        output_path = config["extracted_path"]
+        part_paths = [partition_path(output_path, i) for i in range(len(predicates))]
+        logging.info(f"Extracting {len(predicates)} partitions with {workers} workers.")
+
+        marks = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    extract_partition, fields, combine_predicates(where, since), part, batch_size,
+                    watermark_column, marks
+                )
+                for where, part in zip(predicates, part_paths)
+            ]
+            total = sum(f.result() for f in futures)
+
+        if is_enabled(config.get("extract_partition_files")):
+            outputs = part_paths
+        else:
+            merge_parts(part_paths, output_path)
+            for part in part_paths:
+                os.remove(part)
+            outputs = [output_path]
+
+        save_incremental_state(watermark_column, marks, config)
+        logging.info(f"Partitioned extraction complete. {total} rows in {len(outputs)} file(s).")
+        return outputs
+    except Exception as e:
+        logging.error(f"Partitioned extraction failed: {e}")
+        raise
+
 def main():
     update_etl_config(config["config_file"])
     config_df = load_config(config["config_file"])
     requested_fields = get_requested_fields(config_df)
-    extract_data(requested_fields, config)
+    if config.get("extract_partition_column") or config.get("extract_predicates"):
+        extract_partitioned(requested_fields, config)
+    else:
+        extract_data(requested_fields, config)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,175 @@
+import os
+import shutil
+import logging
+import pandas as pd
+
+# Intermediate files between stages are CSV or Parquet, picked by file extension
+# (.parquet / .pq), so each stage's path in .env chooses its own format.
+# pyarrow is only imported when a Parquet path is actually used.
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+PARQUET_COMPRESSION = "zstd"
+
+def detect_format(path):
+    return "parquet" if str(path).lower().endswith(PARQUET_EXTENSIONS) else "csv"
+
+def read_columns(path):
+    if detect_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+# Reads a whole file; Parquet is memory-mapped and only the requested columns are decoded
+def read_frame(path, columns=None):
+    if detect_format(path) == "parquet":
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    return pd.read_csv(path, usecols=columns)
+
+# Yields DataFrames of at most chunksize rows. CSV columns are read as text so the
+# dtype of a column cannot change from one chunk to the next; Parquet keeps its schema.
+def iter_frames(path, chunksize, columns=None):
+    if detect_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, chunksize=chunksize, usecols=columns, dtype=str)
+
+def write_frame(df, path):
+    if detect_format(path) == "parquet":
+        df.to_parquet(path, index=False, compression=PARQUET_COMPRESSION)
+    else:
+        df.to_csv(path, index=False)
+
+# Writes each batch to the CSV as it passes through; the header is written once.
+# Being a generator, it can checkpoint a stream to disk without consuming it.
+def tee_csv_batches(batches, path, columns):
+    header = True
+    with open(path, 'w', newline='') as f:
+        for df in batches:
+            df.to_csv(f, index=False, header=header)
+            header = False
+            yield df
+        if header:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+
+# Type a column written so far as old_type must take to also hold new_type:
+# a column that has only seen nulls takes the first real type, integers widen to
+# float64 when a fractional value turns up, and any other conflict becomes text
+def merge_arrow_type(old_type, new_type, placeholder=False):
+    import pyarrow as pa
+
+    if pa.types.is_null(new_type) or old_type == new_type:
+        return old_type
+    if placeholder:
+        return new_type
+    if pa.types.is_integer(old_type) and pa.types.is_integer(new_type):
+        return pa.int64()
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(f(old_type) for f in numeric) and any(f(new_type) for f in numeric):
+        return pa.float64()
+    return pa.string()
+
+# Appends each batch as a row group as it passes through. The schema comes from the
+# first batch, with all-null columns written as string until a real type shows up.
+# A batch that does not fit (e.g. ints in a so-far-null column, or fractions in an
+# int column) widens the schema, and the row groups already written are copied into
+# a new file under it, so a schema change costs one rewrite instead of failing.
+def tee_parquet_batches(batches, path, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    schema = None
+    placeholders = set()
+    part = 0
+    current = None
+    try:
+        for df in batches:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                placeholders = {f.name for f in table.schema if pa.types.is_null(f.type)}
+                schema = pa.schema([
+                    pa.field(f.name, pa.string()) if f.name in placeholders else f for f in table.schema
+                ])
+                current = f"{path}.part{part}"
+                writer = pq.ParquetWriter(current, schema, compression=PARQUET_COMPRESSION)
+
+            merged = pa.schema([
+                pa.field(f.name, merge_arrow_type(f.type, table.schema.field(f.name).type, f.name in placeholders))
+                for f in schema
+            ])
+            try:
+                table = table.select(schema.names).cast(merged)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                # e.g. text in a numeric column: fall back to string for the conflicting columns
+                merged = pa.schema([
+                    f if table.schema.field(f.name).type == f.type else pa.field(f.name, pa.string())
+                    for f in merged
+                ])
+                table = table.select(schema.names).cast(merged)
+
+            if merged != schema:
+                writer.close()
+                part += 1
+                previous, current = current, f"{path}.part{part}"
+                writer = pq.ParquetWriter(current, merged, compression=PARQUET_COMPRESSION)
+                written = pq.ParquetFile(previous)
+                for i in range(written.num_row_groups):
+                    writer.write_table(written.read_row_group(i).cast(merged))
+                os.remove(previous)
+                logging.info(f"Widened the schema of {path} to {merged}")
+                schema = merged
+
+            placeholders = {
+                name for name in placeholders if pa.types.is_null(table.schema.field(name).type)
+                or table.column(name).null_count == len(table)
+            }
+            writer.write_table(table)
+            yield df
+
+        if writer is None:
+            empty = pa.schema([pa.field(col, pa.string()) for col in columns])
+            pq.write_table(empty.empty_table(), path, compression=PARQUET_COMPRESSION)
+    finally:
+        if writer is not None:
+            writer.close()
+            if os.path.exists(current):
+                os.replace(current, path)
+
+def tee_batches(batches, path, columns):
+    if detect_format(path) == "parquet":
+        return tee_parquet_batches(batches, path, columns)
+    return tee_csv_batches(batches, path, columns)
+
+def write_csv_batches(batches, path, columns):
+    return sum(len(df) for df in tee_csv_batches(batches, path, columns))
+
+# Consumes the batches into path and returns the number of rows written
+def write_batches(batches, path, columns):
+    return sum(len(df) for df in tee_batches(batches, path, columns))
+
+# Concatenates part files into one output, keeping only the first CSV header
+# or appending Parquet row groups under one schema
+def merge_parts(part_paths, path):
+    if detect_format(path) == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Parts are typed independently (e.g. int64 in one, double where another saw NULLs)
+        schema = pa.unify_schemas(
+            [pq.read_schema(part) for part in part_paths], promote_options="permissive"
+        )
+        with pq.ParquetWriter(path, schema, compression=PARQUET_COMPRESSION) as writer:
+            for part in part_paths:
+                parquet_file = pq.ParquetFile(part)
+                for i in range(parquet_file.num_row_groups):
+                    writer.write_table(parquet_file.read_row_group(i).cast(schema))
+        return
+
+    with open(path, 'wb') as out:
+        for i, part in enumerate(part_paths):
+            with open(part, 'rb') as f:
+                if i > 0:
+                    f.readline()
+                shutil.copyfileobj(f, out)
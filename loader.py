@@ -1,12 +1,17 @@
 import os
+import io
+import time
 import logging
-import psycopg2
-import pandas as pd
-import json
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from config_paths import config
-from bookembeddings import generate_book_embeddings
+from config_paths import config, is_enabled
+from db_connect import get_connection, release_connection
+from frame_io import detect_format, read_columns, iter_frames
+from embedding_cache import get_default_cache
+from model_registry import encode
+from vector_io import copy_payload, open_vectors
+from pg_export import export_table
+import metrics
+from bookembeddings import generate_book_embeddings, book_key, embeddings_path, BOOK_PATH, OUTPUT_CSV, BOOK_COLUMNS
 
 # Setup logging
 logging.basicConfig(
@@ -17,24 +22,138 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv()
 
-# Load embedding model (768-dimension)
-model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
+# Rows per COPY when loading a Parquet file
+COPY_BATCH_SIZE = 50000
 
+# Descriptions per model.encode call, and how many encoded batches go in one commit
+DEFAULT_EMBED_BATCH_SIZE = 128
+DEFAULT_EMBED_COMMIT_EVERY = 10
+
+# Borrows a session from the shared pool in db_connect; hand it back with release_connection
 def get_pg_connection():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        user=os.getenv("DB_USERNAME"),
-        password=os.getenv("DB_PASSWORD"),
-        dbname=os.getenv("DB_NAME")
+    return get_connection()
+
+def get_table_columns(cursor, table_name):
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name = %s
+        ORDER BY ordinal_position
+    """, (table_name.lower(),))
+    return [row[0] for row in cursor.fetchall()]
+
+# Builds the INSERT ... ON CONFLICT statement that merges the staging table into the target.
+# Only rows whose values actually changed are rewritten, and an existing embedding is kept
+# unless the description it was computed from has changed.
+def build_merge_query(table_name, staging_table, columns, key, table_columns):
+    column_list = ', '.join([f'"{col}"' for col in columns])
+    updates = [col for col in columns if col != key]
+    insert = f"""
+        INSERT INTO "{table_name}" AS t ({column_list})
+        SELECT DISTINCT ON ("{key}") {column_list} FROM "{staging_table}"
+        ORDER BY "{key}"
+        ON CONFLICT ("{key}")"""
+
+    if not updates:
+        return insert + " DO NOTHING"
+
+    set_clause = ', '.join([f'"{col}" = EXCLUDED."{col}"' for col in updates])
+    if 'embedding' in table_columns and 'description' in updates:
+        set_clause += (
+            ', embedding = CASE WHEN t."description" IS DISTINCT FROM EXCLUDED."description"'
+            ' THEN NULL ELSE t.embedding END'
+        )
+
+    current = ', '.join([f't."{col}"' for col in updates])
+    incoming = ', '.join([f'EXCLUDED."{col}"' for col in updates])
+    return insert + f"""
+        DO UPDATE SET {set_clause}
+        WHERE ROW({current}) IS DISTINCT FROM ROW({incoming})"""
+
+def copy_command_for(table_name, columns):
+    column_list = ', '.join([f'"{col}"' for col in columns])
+    return f'COPY "{table_name}" ({column_list}) FROM STDIN WITH CSV HEADER'
+
+# COPYs each DataFrame through an in-memory CSV buffer
+def copy_frames_into_table(cursor, frames, table_name, columns):
+    copy_command = copy_command_for(table_name, columns)
+    total = 0
+    for df in frames:
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False)
+        nbytes = buffer.tell()
+        buffer.seek(0)
+        cursor.copy_expert(copy_command, buffer)
+        total += len(df)
+        metrics.count("load", rows=len(df), nbytes=nbytes)
+    return total
+
+# COPYs a CSV file as-is, or a Parquet file batch by batch
+def copy_file_into_table(cursor, path, table_name, columns):
+    if detect_format(path) == "csv":
+        with open(path, 'r') as f:
+            cursor.copy_expert(copy_command_for(table_name, columns), f)
+        try:
+            metrics.count("load", nbytes=os.path.getsize(path))
+        except OSError as e:
+            logging.warning(f"Could not measure {path} for the load metrics: {e}")
+        return
+    copy_frames_into_table(cursor, iter_frames(path, COPY_BATCH_SIZE), table_name, columns)
+
+# True when a plain unique index (or primary key / unique constraint) covers exactly `key`
+def has_unique_key(cursor, table_name, key):
+    cursor.execute("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = %s::regclass
+          AND i.indisunique
+          AND i.indnkeyatts = 1
+          AND i.indpred IS NULL
+          AND a.attname = %s
+        LIMIT 1
+    """, (f'"{table_name}"', key))
+    return cursor.fetchone() is not None
+
+# COPYs into a temp staging table (not WAL-logged, dropped on commit)
+# and upserts it into the target table on the key column
+def merge_into_table(cursor, copy, table_name, columns, key):
+    staging_table = f"{table_name}_staging"
+
+    # ON CONFLICT needs a unique index on the key. Building one here would take a lock
+    # and scan the table on every run, so it has to exist already.
+    if not has_unique_key(cursor, table_name, key):
+        logging.error(f"Table '{table_name}' has no unique index on merge key '{key}'.")
+        raise ValueError(
+            f'LOAD_MODE=merge needs a unique index on "{table_name}" ("{key}"); create it once with '
+            f'CREATE UNIQUE INDEX ON "{table_name}" ("{key}")'
+        )
+
+    cursor.execute(
+        f'CREATE TEMP TABLE "{staging_table}" (LIKE "{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP'
     )
+    copy(cursor, staging_table)
+
+    table_columns = get_table_columns(cursor, table_name)
+    cursor.execute(build_merge_query(table_name, staging_table, columns, key, table_columns))
+    return cursor.rowcount
+
+# Replaces or merges the table contents in one transaction.
+# `copy(cursor, target_table)` streams the new rows into the given table.
+@metrics.timed("load")
+def load_into_table(copy, table_name, columns, mode=None, key=None):
+    mode = (mode or config.get("load_mode") or "replace").lower()
+    key = (key or config.get("load_key") or "sysdocid").lower()
 
-def load_csv_to_postgres(csv_path, table_name):
-    df_columns = pd.read_csv(csv_path, nrows=0).columns
-    normalized_columns = [col.lower() for col in df_columns]
+    if mode == "merge" and key not in columns:
+        logging.error(f"Merge key '{key}' not found in columns: {columns}")
+        raise ValueError(f"Merge key '{key}' not found in columns")
 
-    column_list = ', '.join([f'"{col}"' for col in normalized_columns])
-    copy_command = f'COPY "{table_name}" ({column_list}) FROM STDIN WITH CSV HEADER'
+    # An incremental extract holds only the rows since the last run; replacing the
+    # table with it would drop everything loaded before
+    if mode != "merge" and config.get("extract_watermark_column"):
+        logging.error(f"LOAD_MODE={mode} with EXTRACT_WATERMARK_COLUMN set would delete earlier rows.")
+        raise ValueError("Incremental extraction (EXTRACT_WATERMARK_COLUMN) requires LOAD_MODE=merge")
 
     conn = None
     cursor = None
@@ -42,14 +161,19 @@ def load_csv_to_postgres(csv_path, table_name):
         conn = get_pg_connection()
         cursor = conn.cursor()
 
+        if mode == "merge":
+            changed = merge_into_table(cursor, copy, table_name, columns, key)
+            conn.commit()
+            logging.info(f"Merged data into '{table_name}' on '{key}': {changed} rows inserted or updated.")
+            return
+
         cursor.execute(f'DELETE FROM "{table_name}"')
         logging.info(f"Cleared existing data from '{table_name}'.")
 
-        with open(csv_path, 'r') as f:
-            cursor.copy_expert(copy_command, f)
+        copy(cursor, table_name)
 
         conn.commit()
-        logging.info(f"CSV data loaded into '{table_name}'.")
+        logging.info(f"Data loaded into '{table_name}'.")
     except Exception as e:
         logging.error(f"Failed to load data: {e}")
         raise
@@ -57,7 +181,22 @@ def load_csv_to_postgres(csv_path, table_name):
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
+            release_connection(conn)
+
+def load_csv_to_postgres(csv_path, table_name, mode=None, key=None):
+    columns = [col.lower() for col in read_columns(csv_path)]
+    load_into_table(
+        lambda cursor, target: copy_file_into_table(cursor, csv_path, target, columns),
+        table_name, columns, mode, key
+    )
+
+# Loads a stream of DataFrames without an intermediate file
+def load_frames_to_postgres(frames, table_name, columns, mode=None, key=None):
+    columns = [col.lower() for col in columns]
+    load_into_table(
+        lambda cursor, target: copy_frames_into_table(cursor, frames, target, columns),
+        table_name, columns, mode, key
+    )
 
 def ensure_embedding_column(conn, table_name):
     with conn.cursor() as cur:
@@ -73,107 +212,232 @@ def ensure_embedding_column(conn, table_name):
         else:
             logging.info("'embedding' column already exists in the table.")
 
-def generate_embeddings(table_name):
-    conn = get_pg_connection()
-    ensure_embedding_column(conn, table_name)
-
-    with conn.cursor() as cur:
-        cur.execute(f'SELECT * FROM "{table_name}" WHERE embedding IS NULL')
-        rows = cur.fetchall()
-        colnames = [desc[0].lower() for desc in cur.description]
+def get_column_type(cur, table_name, column):
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attname = %s
+    """, (f'"{table_name}"', column))
+    return cur.fetchone()[0]
+
+# Session-local staging table that embedding batches are binary-COPYed into
+def create_embedding_stage(cur):
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS embedding_stage (id text, embedding vector)")
+
+# The 768-dimension model is loaded on first use and shared with bookembeddings
+def encode_texts(texts, batch_size):
+    return encode(texts, batch_size)
+
+# Writes a batch of embeddings as float32 through a binary COPY into the staging table,
+# then one UPDATE ... FROM; the staged id is cast to the key's type so its index is used
+def write_embeddings(cur, table_name, id_col, ids, embeddings, id_type="text"):
+    cur.execute("TRUNCATE embedding_stage")
+    cur.copy_expert(
+        "COPY embedding_stage (id, embedding) FROM STDIN WITH (FORMAT binary)",
+        copy_payload([ids, embeddings], ["text", "vector"])
+    )
+    cur.execute(f"""
+        UPDATE "{table_name}" AS t
+        SET embedding = s.embedding
+        FROM embedding_stage AS s
+        WHERE t."{id_col}" = s.id::{id_type}
+    """)
+
+# Pages through the rows still missing an embedding with a named (server-side)
+# cursor, fetching only the id and description, so client memory stays at one page
+def iter_rows_needing_embeddings(conn, table_name, id_col, page_size):
+    with conn.cursor(name="embedding_rows") as cur:
+        cur.itersize = page_size
+        cur.execute(f'SELECT "{id_col}", description FROM "{table_name}" WHERE embedding IS NULL')
+        while True:
+            rows = cur.fetchmany(page_size)
+            if not rows:
+                break
+            yield rows
+
+@metrics.timed("embeddings")
+def generate_embeddings(table_name, batch_size=None, commit_every=None):
+    batch_size = int(batch_size or config.get("embed_batch_size") or DEFAULT_EMBED_BATCH_SIZE)
+    commit_every = int(commit_every or config.get("embed_commit_every") or DEFAULT_EMBED_COMMIT_EVERY)
+    sort_by_length = config.get("embed_sort_by_length") is None or is_enabled(config.get("embed_sort_by_length"))
+
+    # Each page is sorted, encoded in commit_every batches and committed
+    page_size = batch_size * commit_every
 
-        if not rows:
-            logging.info("No rows found that need embeddings.")
-            return
+    conn = get_pg_connection()
+    read_conn = None
+    try:
+        ensure_embedding_column(conn, table_name)
 
+        with conn.cursor() as cur:
+            colnames = get_table_columns(cur, table_name)
         if 'description' not in colnames:
             logging.error("Required column 'description' not found.")
             return
 
         id_col = 'sysdocid' if 'sysdocid' in colnames else colnames[0]
-        id_idx = colnames.index(id_col)
-        desc_idx = colnames.index('description')
-
-        logging.info(f"Generating embeddings for {len(rows)} rows...")
-
-        for row in rows:
-            doc_id = row[id_idx]
-            description = row[desc_idx] or ""
-
-            try:
-                embedding = model.encode(description, normalize_embeddings=True).tolist()
-                embedding_str = "[" + ",".join(map(str, embedding)) + "]"
-
-                cur.execute(f"""
-                    UPDATE "{table_name}"
-                    SET embedding = %s::vector
-                    WHERE "{id_col}" = %s
-                """, (embedding_str, doc_id))
-
-                logging.info(f"Updated embedding for {id_col}: {doc_id}")
-            except Exception as e:
-                logging.error(f"Failed to update embedding for {id_col} {doc_id}: {e}")
+        with conn.cursor() as cur:
+            id_type = get_column_type(cur, table_name, id_col)
+            create_embedding_stage(cur)
+        conn.commit()
 
-    conn.commit()
-    conn.close()
-    logging.info("All embeddings updated successfully.")
+        # The server-side cursor lives in its own transaction on a second connection,
+        # so committing the writes does not close it
+        read_conn = get_pg_connection()
+
+        done = 0
+        failed = 0
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            for rows in iter_rows_needing_embeddings(read_conn, table_name, id_col, page_size):
+                # Sorting the page by length groups similar lengths into the same
+                # encode batch, so little of each batch is padding
+                if sort_by_length:
+                    rows.sort(key=lambda row: len(row[1] or ""))
+
+                try:
+                    for offset in range(0, len(rows), batch_size):
+                        batch = rows[offset:offset + batch_size]
+                        embeddings = encode_texts([row[1] or "" for row in batch], batch_size)
+                        write_embeddings(cur, table_name, id_col, [row[0] for row in batch], embeddings, id_type)
+                    conn.commit()
+                    done += len(rows)
+                    metrics.count("embeddings", rows=len(rows))
+                except Exception as e:
+                    # The page keeps a NULL embedding and is picked up by the next run
+                    conn.rollback()
+                    failed += len(rows)
+                    logging.error(f"Failed to update embeddings for a page of {len(rows)} rows: {e}")
+                    continue
+
+                elapsed = time.perf_counter() - start
+                logging.info(f"Committed {done} embeddings ({done / max(elapsed, 1e-9):.0f} rows/sec)")
+
+        if not done and not failed:
+            logging.info("No rows found that need embeddings.")
+            return
 
-def export_table_to_csv(table_name, output_file):
+        elapsed = time.perf_counter() - start
+        if failed:
+            logging.warning(f"{failed} rows were not embedded and will be retried on the next run.")
+        logging.info(f"Updated {done} embeddings in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.0f} rows/sec).")
+        cache = get_default_cache()
+        if cache is not None:
+            logging.info(f"Embedding cache: {cache.stats()}")
+    finally:
+        if read_conn:
+            release_connection(read_conn)
+        release_connection(conn)
+
+# Streams the table to output_file (CSV, .csv.gz or Parquet) with COPY, optionally only
+# `columns`; embeddings go to a .npy beside it unless EXPORT_EMBEDDING says otherwise
+@metrics.timed("export")
+def export_table_to_csv(table_name, output_file, columns=None, embedding=None):
     conn = get_pg_connection()
     try:
-        df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
-        df.to_csv(output_file, index=False)
-        logging.info(f"Exported table '{table_name}' to CSV: {output_file}")
+        with conn.cursor() as cur:
+            id_col = 'sysdocid' if 'sysdocid' in get_table_columns(cur, table_name) else None
+            rows, _ = export_table(cur, table_name, output_file, columns, embedding, id_col)
+        metrics.count("export", rows=rows, nbytes=os.path.getsize(output_file))
+        logging.info(f"Exported {rows} rows of table '{table_name}' to {output_file}")
     except Exception as e:
         logging.error(f"Failed to export table to CSV: {e}")
     finally:
-        conn.close()
-
-def ensure_bookembedding_column(conn, table_name):
+        release_connection(conn)
+
+# Book chunks live in their own table, one row per chunk, linked to documents through
+# a book_key column on the document table (the PDF's file name)
+BOOK_CHUNKS_DDL = """
+    CREATE TABLE IF NOT EXISTS book_chunks (
+        id uuid PRIMARY KEY,
+        book_key text NOT NULL,
+        page integer NOT NULL,
+        chunk_idx integer NOT NULL,
+        text text,
+        embedding vector(768) NOT NULL,
+        UNIQUE (book_key, page, chunk_idx)
+    )
+"""
+# Built after the bulk load; inner product matches the normalized embeddings
+BOOK_CHUNKS_INDEX_DDL = """
+    CREATE INDEX IF NOT EXISTS book_chunks_embedding_hnsw
+    ON book_chunks USING hnsw (embedding vector_ip_ops)
+"""
+
+def ensure_book_key_column(conn, table_name):
     with conn.cursor() as cur:
         cur.execute("""
             SELECT column_name
             FROM information_schema.columns
-            WHERE table_name = %s AND column_name = 'bookembeddings'
+            WHERE table_name = %s AND column_name = 'book_key'
         """, (table_name.lower(),))
         if not cur.fetchone():
-            logging.info("Adding 'bookembeddings' column to table...")
-            cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN bookembeddings jsonb')
+            logging.info("Adding 'book_key' column to table...")
+            cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN book_key text')
             conn.commit()
-        else:
-            logging.info("'bookembeddings' column already exists in the table.")
 
-def update_book_embeddings(table_name, book_embedding_df):
+# Replaces the book's rows in book_chunks from the chunk file and its .npy vectors with
+# binary COPY, links documents without a book to it, and builds the HNSW index, all in
+# one transaction
+@metrics.timed("load_book_chunks")
+def load_book_chunks(table_name, chunks_path, book_key, vectors_path=None):
+    vectors = open_vectors(vectors_path or embeddings_path(chunks_path))
     conn = get_pg_connection()
-    ensure_bookembedding_column(conn, table_name)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(BOOK_CHUNKS_DDL)
+        conn.commit()
+        ensure_book_key_column(conn, table_name)
+
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM book_chunks WHERE book_key = %s", (book_key,))
+            offset = 0
+            for df in iter_frames(chunks_path, COPY_BATCH_SIZE, BOOK_COLUMNS):
+                cur.copy_expert(
+                    "COPY book_chunks (id, book_key, page, chunk_idx, text, embedding) FROM STDIN WITH (FORMAT binary)",
+                    copy_payload(
+                        [df["id"], [book_key] * len(df), df["page"], df["chunk_idx"], df["text"].fillna(""),
+                         vectors[offset:offset + len(df)]],
+                        ["uuid", "text", "int4", "int4", "text", "vector"]
+                    )
+                )
+                offset += len(df)
+            if offset != len(vectors):
+                raise ValueError(f"{chunks_path} has {offset} chunks but its vectors file has {len(vectors)}")
+
+            cur.execute(f'UPDATE "{table_name}" SET book_key = %s WHERE book_key IS NULL', (book_key,))
+            cur.execute(BOOK_CHUNKS_INDEX_DDL)
+        conn.commit()
+        metrics.count("load_book_chunks", rows=offset)
+        logging.info(f"Loaded {offset} chunks of '{book_key}' into book_chunks.")
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Failed to load book chunks: {e}")
+        raise
+    finally:
+        release_connection(conn)
 
-    book_embeddings = book_embedding_df[['id', 'page', 'chunk_idx', 'text', 'embedding']].to_dict(orient='records')
+# Everything that runs once the table is loaded
+def run_post_load_steps(table_name, output_csv="loader_file.csv"):
+    if is_enabled(config.get("load_async")):
+        # Pipelined fetch / encode / write on asyncpg, which is only needed in this mode
+        import async_loader
+        async_loader.generate_embeddings(table_name)
+    else:
+        generate_embeddings(table_name)
 
-    with conn.cursor() as cur:
-        # Assuming single row to update or adapt with condition
-        cur.execute(f"""
-            UPDATE "{table_name}"
-            SET bookembeddings = %s
-            WHERE bookembeddings IS NULL
-        """, (json.dumps(book_embeddings),))
+    # Generate book embeddings
+    generate_book_embeddings(BOOK_PATH, OUTPUT_CSV, return_df=False)
+    load_book_chunks(table_name, OUTPUT_CSV, book_key(BOOK_PATH))
 
-    conn.commit()
-    conn.close()
-    logging.info("Book embeddings updated in table.")
+    export_table_to_csv(table_name, output_csv)
 
 def main():
     csv_path = config["transformation_path"]
     table_name = os.getenv("DEST_TABLE") or "loader_table"
-    output_csv = "loader_file.csv"
 
     load_csv_to_postgres(csv_path, table_name)
-    generate_embeddings(table_name)
-
-    # Generate book embeddings
-    book_embedding_df = generate_book_embeddings()
-    update_book_embeddings(table_name, book_embedding_df)
-
-    export_table_to_csv(table_name, output_csv)
+    run_post_load_steps(table_name)
+    metrics.finish_run()
 
 if __name__ == "__main__":
     main()
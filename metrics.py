@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import time
+import uuid
+import bisect
+import random
+import socket
+import logging
+import resource
+import datetime
+import functools
+import itertools
+import threading
+from contextlib import contextmanager
+from config_paths import config
+
+# Run metrics for the pipeline stages: wall and self time (time not spent in nested
+# stages), calls, rows, bytes and peak RSS per stage, plus latency histograms such as
+# encode_batch_seconds. finish_run() logs a summary, writes the JSON run report to
+# METRICS_REPORT and, when METRICS_TEXTFILE is set, a Prometheus textfile for
+# node_exporter's textfile collector. Only this process is measured: OCR and encode
+# worker processes report through the stages that wait on them.
+DEFAULT_SAMPLE_INTERVAL = 0.05
+# Seconds; Prometheus' default buckets stretched for model batches
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROMETHEUS_PREFIX = "etl"
+# Values kept per histogram for the quantiles
+RESERVOIR_SIZE = 2048
+
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}
+_histograms = {}
+_active = set()
+_sampler = None
+_run = {}
+
+# ru_maxrss is in bytes on macOS and in KB elsewhere
+def peak_rss_mb():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1e6 if sys.platform == "darwin" else maxrss / 1e3
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1e6
+    except (OSError, ValueError, IndexError):
+        # No (readable) /proc, e.g. macOS: fall back to the peak. Metrics must never
+        # break the stage being measured.
+        return peak_rss_mb()
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.child_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.peak_rss_mb = 0.0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "seconds": round(self.seconds, 4),
+            "self_seconds": round(max(self.seconds - self.child_seconds, 0.0), 4),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "rows_per_sec": round(self.rows / self.seconds, 1) if self.seconds else None,
+            "peak_rss_mb": round(self.peak_rss_mb, 1)
+        }
+
+# Bucket counts, sum and extremes are exact; quantiles come from a uniform reservoir
+# sample, so a long run keeps constant memory however many values it observes
+class Histogram:
+    def __init__(self, name, buckets=DEFAULT_BUCKETS, reservoir_size=RESERVOIR_SIZE):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.reservoir_size = reservoir_size
+        self.reservoir = []
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.reservoir_size:
+                self.reservoir[slot] = value
+
+    def quantile(self, q):
+        ordered = sorted(self.reservoir)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else None
+
+    # Cumulative counts per upper bound, as Prometheus expects
+    def bucket_counts(self):
+        return list(zip(self.buckets, itertools.accumulate(self.counts)))
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "min": round(self.min, 4) if self.min is not None else None,
+            "max": round(self.max, 4) if self.max is not None else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in self.bucket_counts()}
+        }
+
+def get_stage(name):
+    with _lock:
+        if name not in _stages:
+            _stages[name] = StageStats(name)
+            _run.setdefault("started_at", time.time())
+        return _stages[name]
+
+def _sample_active():
+    rss = current_rss_mb()
+    with _lock:
+        for stats in _active:
+            stats.peak_rss_mb = max(stats.peak_rss_mb, rss)
+
+# Polls RSS while any stage is running, so a spike in the middle of a stage is seen
+def _sample_loop():
+    interval = float(config.get("metrics_sample_interval") or DEFAULT_SAMPLE_INTERVAL)
+    while True:
+        if _active:
+            _sample_active()
+        time.sleep(interval)
+
+def _ensure_sampler():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="metrics-rss", daemon=True)
+            _sampler.start()
+
+# Times a block as one call of the named stage and yields its StageStats, so the
+# block can add rows and bytes. Stages nest per thread; a nested stage's time is
+# subtracted from its parent's self_seconds.
+@contextmanager
+def stage(name):
+    _ensure_sampler()
+    stats = get_stage(name)
+    stack = _local.__dict__.setdefault("stack", [])
+    stack.append(stats)
+    with _lock:
+        _active.add(stats)
+    _sample_active()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        seconds = time.perf_counter() - start
+        _sample_active()
+        stack.pop()
+        with _lock:
+            stats.calls += 1
+            stats.seconds += seconds
+            if stats not in stack:
+                _active.discard(stats)
+            if stack and stack[-1] is not stats:
+                stack[-1].child_seconds += seconds
+
+# Decorator form of stage(); rows, when given, is called on the result to count rows
+def timed(name, rows=None):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name) as stats:
+                result = fn(*args, **kwargs)
+                if rows is not None:
+                    stats.rows += rows(result)
+                return result
+        return wrapper
+    return decorate
+
+# Passes the items of a (lazy) iterable through, timing only the time spent producing
+# each one, so a streaming stage is measured apart from the stages consuming it
+def timed_iter(name, iterable, rows=len):
+    it = iter(iterable)
+    while True:
+        with stage(name) as stats:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            if rows is not None:
+                stats.rows += rows(item)
+        yield item
+
+# Adds rows / bytes to a stage without timing anything
+def count(name, rows=0, nbytes=0):
+    stats = get_stage(name)
+    with _lock:
+        stats.rows += rows
+        stats.bytes += nbytes
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = Histogram(name, buckets)
+        _histograms[name].observe(value)
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _histograms.clear()
+        _run.clear()
+
+def report():
+    with _lock:
+        started_at = _run.get("started_at", time.time())
+        finished_at = time.time()
+        return {
+            "run_id": _run.setdefault("run_id", uuid.uuid4().hex),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_at": datetime.datetime.fromtimestamp(started_at, datetime.timezone.utc).isoformat(),
+            "finished_at": datetime.datetime.fromtimestamp(finished_at, datetime.timezone.utc).isoformat(),
+            "duration_seconds": round(finished_at - started_at, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "stages": [stats.as_dict() for stats in _stages.values()],
+            "histograms": {name: hist.as_dict() for name, hist in _histograms.items()}
+        }
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def write_report(path, data=None):
+    _write_atomic(path, json.dumps(data or report(), indent=2))
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+# Prometheus text exposition format; the textfile collector only reads whole files,
+# hence the atomic replace
+def prometheus_text(data=None):
+    data = data or report()
+    lines = []
+    gauges = [
+        ("stage_seconds", "seconds", "Wall time per stage in the last run"),
+        ("stage_self_seconds", "self_seconds", "Stage time excluding nested stages"),
+        ("stage_calls", "calls", "Timed calls per stage"),
+        ("stage_rows", "rows", "Rows processed per stage"),
+        ("stage_bytes", "bytes", "Bytes processed per stage"),
+        ("stage_peak_rss_mb", "peak_rss_mb", "Peak resident memory during the stage, MB"),
+    ]
+    for metric, key, help_text in gauges:
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} gauge")
+        for stats in data["stages"]:
+            lines.append(f'{PROMETHEUS_PREFIX}_{metric}{{stage="{_label(stats["stage"])}"}} {stats[key]}')
+
+    with _lock:
+        histograms = list(_histograms.values())
+    for hist in histograms:
+        metric = f"{PROMETHEUS_PREFIX}_{hist.name}"
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, bucket_count in hist.bucket_counts():
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {bucket_count}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {hist.count}')
+        lines.append(f"{metric}_sum {hist.sum}")
+        lines.append(f"{metric}_count {hist.count}")
+
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge")
+    lines.append(f"{PROMETHEUS_PREFIX}_run_duration_seconds {data['duration_seconds']}")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_run_peak_rss_mb gauge")
+    lines.append(f"{PROMETHEUS_PREFIX}_run_peak_rss_mb {data['peak_rss_mb']}")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_run_finished_timestamp_seconds gauge")
+    lines.append(f"{PROMETHEUS_PREFIX}_run_finished_timestamp_seconds {time.time():.0f}")
+    return "\n".join(lines) + "\n"
+
+# Ends a run: logs one line per stage and writes the configured outputs
+def finish_run():
+    data = report()
+    for stats in data["stages"]:
+        logging.info(
+            f"Stage {stats['stage']}: {stats['seconds']:.2f}s ({stats['self_seconds']:.2f}s self), "
+            f"{stats['rows']} rows, {stats['bytes']} bytes, peak RSS {stats['peak_rss_mb']:.0f} MB"
+        )
+    if config.get("metrics_report"):
+        write_report(config["metrics_report"], data)
+        logging.info(f"Run report written to {config['metrics_report']}")
+    if config.get("metrics_textfile"):
+        _write_atomic(config["metrics_textfile"], prometheus_text(data))
+    return data
@@ -0,0 +1,178 @@
+import os
+import time
+import zlib
+import atexit
+import logging
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from config_paths import config, is_enabled
+from embedding_cache import encode_with_cache, get_default_cache
+import metrics
+from metrics import current_rss_mb
+
+# One lazily constructed SentenceTransformer per model name, shared by the loader
+# and bookembeddings. Nothing is loaded at import time; the first encode pays the
+# cold start and every later caller reuses the same instance.
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+# Dimension of the stub model, matching the vector(768) columns
+STUB_DIM = 768
+
+_models = {}
+_load_stats = {}
+_lock = threading.Lock()
+_pools = {}
+
+# Deterministic stand-in for a SentenceTransformer (EMBED_BACKEND=stub): signed hashed
+# word counts, so benchmarks and smoke tests run without torch or a model download
+class HashingModel:
+    def __init__(self, dim=STUB_DIM):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True, **kwargs):
+        vecs = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.encode("utf-8"))
+                vecs[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            vecs /= np.where(norms == 0, 1.0, norms)
+        return vecs
+
+def _load(name):
+    backend = (config.get("embed_backend") or "torch").lower()
+    if backend == "stub":
+        return HashingModel()
+
+    from sentence_transformers import SentenceTransformer
+
+    threads = config.get("embed_threads")
+    if threads and backend == "torch":
+        import torch
+        torch.set_num_threads(int(threads))
+
+    kwargs = {}
+    if backend != "torch":
+        # "onnx" or "openvino"; EMBED_MODEL_FILE can select a quantized export,
+        # e.g. onnx/model_qint8_avx512_vnni.onnx
+        kwargs["backend"] = backend
+        if config.get("embed_model_file"):
+            kwargs["model_kwargs"] = {"file_name": config["embed_model_file"]}
+
+    model = SentenceTransformer(name, device=config.get("embed_device") or None, **kwargs)
+
+    if backend == "torch" and is_enabled(config.get("embed_quantize")):
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def get_model(name=MODEL_NAME):
+    with _lock:
+        if name not in _models:
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            _models[name] = _load(name)
+            seconds = time.perf_counter() - start
+            rss_after = current_rss_mb()
+            _load_stats[name] = {
+                "seconds": round(seconds, 2),
+                "rss_delta_mb": round(rss_after - rss_before, 1),
+                "rss_mb": round(rss_after, 1)
+            }
+            logging.info(
+                f"Loaded embedding model {name} in {seconds:.1f}s "
+                f"(RSS +{rss_after - rss_before:.0f} MB, now {rss_after:.0f} MB)"
+            )
+        return _models[name]
+
+def get_load_stats():
+    return dict(_load_stats)
+
+def _init_worker(name, threads):
+    # Read by onnxruntime/openvino and by torch's OpenMP pool when they start
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    get_model(name)
+    if (config.get("embed_backend") or "torch").lower() == "torch":
+        # _load may have applied EMBED_THREADS; the pinned per-worker count wins
+        import torch
+        torch.set_num_threads(threads)
+
+def _encode_in_worker(name, texts, batch_size, normalize_embeddings):
+    return get_model(name).encode(
+        texts, batch_size=batch_size, normalize_embeddings=normalize_embeddings, convert_to_numpy=True
+    )
+
+def get_pool(name, workers, threads):
+    key = (name, workers, threads)
+    with _lock:
+        if key not in _pools:
+            # spawn, not fork: torch's thread pools do not survive a fork
+            _pools[key] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(name, threads)
+            )
+            logging.info(f"Started {workers} encoding workers with {threads} threads each.")
+        return _pools[key]
+
+@atexit.register
+def close_pools():
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+# Drop-in for model.encode that shards the texts into batch_size slices across a
+# process pool. Executor.map returns results in submission order, so row i of the
+# output is always the embedding of texts[i].
+class PooledEncoder:
+    def __init__(self, name, workers, threads=None):
+        self.name = name
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True):
+        if not texts:
+            return np.empty((0, 0), dtype="float32")
+        pool = get_pool(self.name, self.workers, self.threads)
+        shards = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = pool.map(
+            _encode_in_worker,
+            [self.name] * len(shards), shards, [batch_size] * len(shards), [normalize_embeddings] * len(shards)
+        )
+        return np.concatenate(list(results))
+
+# The in-process model, or a process pool when EMBED_WORKERS > 1
+def get_encoder(name=MODEL_NAME):
+    workers = int(config.get("embed_workers") or 1)
+    if workers > 1:
+        threads = int(config["embed_worker_threads"]) if config.get("embed_worker_threads") else None
+        return PooledEncoder(name, workers, threads)
+    return get_model(name)
+
+# Name the embedding cache files vectors under. Backends, exported model files and
+# quantization each produce slightly different vectors, so every variant other than
+# full-precision torch gets its own key and never serves or overwrites another's.
+def cache_model_key(name=MODEL_NAME):
+    backend = (config.get("embed_backend") or "torch").lower()
+    if backend != "torch":
+        return f"{name}|{backend}|{config.get('embed_model_file') or ''}"
+    if is_enabled(config.get("embed_quantize")):
+        return f"{name}|torch-qint8"
+    return name
+
+# Normalized embeddings for texts, through the shared model and the embedding cache.
+# Every call is one sample of the encode_batch_seconds histogram.
+def encode(texts, batch_size, name=MODEL_NAME):
+    start = time.perf_counter()
+    with metrics.stage("encode") as stats:
+        vecs = encode_with_cache(get_encoder(name), cache_model_key(name), texts, batch_size, get_default_cache())
+        stats.rows += len(texts)
+    metrics.observe("encode_batch_seconds", time.perf_counter() - start)
+    return vecs
@@ -0,0 +1,122 @@
+import io
+import os
+import gzip
+import logging
+import tempfile
+from config_paths import config
+from frame_io import detect_format, PARQUET_COMPRESSION
+from vector_io import copy_rows_out, write_vectors
+
+# Table and query exports streamed from the server with COPY ... TO STDOUT, so rows go
+# straight from the socket to the file and memory stays flat whatever the table size.
+# The output is CSV, gzip-compressed CSV (.csv.gz) or Parquet, picked by extension.
+# Embedding columns are left out of the file (EXPORT_EMBEDDING=exclude), written as
+# float32 to a .npy matrix plus .ids.npy beside it (npy, the default) or kept as text (text).
+EMBEDDING_MODES = ("exclude", "npy", "text")
+WRITE_BUFFER_SIZE = 1 << 20
+# Bytes of CSV converted per Parquet record batch
+PARQUET_BLOCK_SIZE = 1 << 24
+
+# Postgres type OIDs with a direct Arrow equivalent; other columns are kept as text
+ARROW_TYPES = {
+    16: "bool",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    700: "float32",
+    701: "float64",
+    1082: "date32",
+}
+
+def is_gzip(path):
+    return str(path).lower().endswith(".gz")
+
+# book.csv -> book.npy, export.csv.gz -> export.npy
+def vectors_path(path):
+    if is_gzip(path):
+        path = path[:-3]
+    return f"{os.path.splitext(path)[0]}.npy"
+
+# (name, type OID) of each column the query returns, without running it
+def query_columns(cur, query):
+    cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+    return [(desc[0], desc[1]) for desc in cur.description]
+
+def copy_sql(query):
+    return f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+
+def copy_to_csv(cur, query, path):
+    if is_gzip(path):
+        with gzip.open(path, 'wb', compresslevel=int(config.get("export_gzip_level") or 6)) as raw:
+            # psycopg2 writes one row per call; buffer so zlib sees large blocks
+            with io.BufferedWriter(raw, WRITE_BUFFER_SIZE) as f:
+                cur.copy_expert(copy_sql(query), f)
+    else:
+        with open(path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            cur.copy_expert(copy_sql(query), f)
+
+# COPY spools CSV to a temporary file, which pyarrow converts to Parquet one block
+# at a time; column types come from the query's result description
+def copy_to_parquet(cur, query, path):
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    column_types = {
+        name: getattr(pa, ARROW_TYPES.get(oid, "string"))() for name, oid in query_columns(cur, query)
+    }
+    with tempfile.TemporaryFile() as spool:
+        cur.copy_expert(copy_sql(query), spool)
+        spool.seek(0)
+        reader = pa_csv.open_csv(
+            spool,
+            read_options=pa_csv.ReadOptions(block_size=PARQUET_BLOCK_SIZE),
+            # Quoted values (descriptions, OCR'd chunk text) may span lines, and a
+            # block boundary can fall inside one
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types,
+                # COPY writes NULL unquoted and the empty string as ""
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+                true_values=["t"],
+                false_values=["f"]
+            )
+        )
+        with pq.ParquetWriter(path, reader.schema, compression=PARQUET_COMPRESSION) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+
+# Writes the query's rows to path; returns the row count reported by COPY
+def export_query(cur, query, path):
+    if detect_format(path) == "parquet":
+        copy_to_parquet(cur, query, path)
+    else:
+        copy_to_csv(cur, query, path)
+    return cur.rowcount
+
+def get_embedding_mode(embedding=None):
+    mode = (embedding or config.get("export_embedding") or "npy").lower()
+    if mode not in EMBEDDING_MODES:
+        raise ValueError(f"Unknown EXPORT_EMBEDDING '{mode}', expected one of {EMBEDDING_MODES}")
+    return mode
+
+# Exports table_name (or only `columns` of it) to path. Returns (rows, vectors), where
+# vectors is the number of embeddings written to the .npy file in npy mode.
+def export_table(cur, table_name, path, columns=None, embedding=None, id_col=None, embedding_col="embedding"):
+    mode = get_embedding_mode(embedding)
+    table_columns = [name for name, _ in query_columns(cur, f'SELECT * FROM "{table_name}"')]
+    columns = [col for col in (columns or table_columns) if mode == "text" or col != embedding_col]
+    select = ", ".join(f'"{col}"' for col in columns)
+    rows = export_query(cur, f'SELECT {select} FROM "{table_name}"', path)
+
+    vectors = 0
+    if mode == "npy" and embedding_col in table_columns:
+        id_col = id_col or table_columns[0]
+        vectors = write_vectors(copy_rows_out(
+            cur,
+            f'SELECT "{id_col}"::text, "{embedding_col}" FROM "{table_name}" WHERE "{embedding_col}" IS NOT NULL',
+            ["text", "vector"]
+        ), vectors_path(path))
+        logging.info(f"Exported {vectors} embeddings from '{table_name}' to {vectors_path(path)}")
+    return rows, vectors
@@ -0,0 +1,52 @@
+import os
+import logging
+from config_paths import config, is_enabled
+from csv_utils import update_etl_config
+from extraction import load_config as load_extraction_config, get_requested_fields, extract_batches, save_incremental_state
+from transformation import load_config as load_transformation_config, compile_plan, transform_data
+from loader import load_frames_to_postgres, run_post_load_steps
+from frame_io import tee_batches
+import metrics
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s:%(message)s'
+)
+
+# Runs extraction -> transformation -> load in one process. Batches flow through
+# generators straight from the JDBC cursor into COPY; the extracted and transformed
+# files are only written when checkpointing is enabled.
+def run_pipeline(checkpoint=False):
+    update_etl_config(config["config_file"])
+    fields = get_requested_fields(load_extraction_config(config["config_file"]))
+
+    config_df = load_transformation_config(config["config_file"])
+    plan = compile_plan(config_df, config.get("date_format"))
+    target_columns = [plan["rename"].get(field, field) for field in fields]
+
+    table_name = os.getenv("DEST_TABLE") or "loader_table"
+
+    marks = []
+    watermark_column, batches = extract_batches(fields, config, marks)
+    if checkpoint:
+        batches = tee_batches(batches, config["extracted_path"], fields)
+
+    transformed = (transform_data(df, config_df, plan) for df in batches)
+    if checkpoint:
+        transformed = tee_batches(transformed, config["transformation_path"], target_columns)
+
+    load_frames_to_postgres(transformed, table_name, target_columns)
+
+    # The load has committed, so the next run can start after these rows
+    save_incremental_state(watermark_column, marks, config)
+    logging.info("Pipeline load complete.")
+
+    run_post_load_steps(table_name)
+    metrics.finish_run()
+
+def main():
+    run_pipeline(checkpoint=is_enabled(config.get("pipeline_checkpoint")))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import numpy as np
+import async_loader
+
+class FakeTransaction:
+    def __init__(self, log):
+        self.log = log
+
+    async def start(self):
+        self.log.append("begin")
+
+    async def commit(self):
+        self.log.append("commit")
+
+    async def rollback(self):
+        self.log.append("rollback")
+
+    async def __aenter__(self):
+        await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.commit()
+
+class FakeCursor:
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    async def fetch(self, n):
+        return self.pages.pop(0) if self.pages else []
+
+def fake_connection(log, pages=()):
+    conn = MagicMock()
+    conn.transaction.side_effect = lambda: FakeTransaction(log)
+    conn.cursor = AsyncMock(return_value=FakeCursor(pages))
+    conn.fetch = AsyncMock(return_value=[("sysdocid",), ("description",), ("embedding",)])
+    conn.fetchval = AsyncMock(side_effect=lambda sql, *args: "integer" if "format_type" in sql else "public")
+    conn.execute = AsyncMock()
+    conn.set_type_codec = AsyncMock()
+    conn.close = AsyncMock()
+
+    async def copy_records(table, records, columns):
+        log.append(("copy", [record[0] for record in records]))
+    conn.copy_records_to_table = AsyncMock(side_effect=copy_records)
+    return conn
+
+class TestAsyncEmbeddings(unittest.TestCase):
+
+    def run_pipeline(self, pages, encode):
+        write_log, read_log = [], []
+        write_conn = fake_connection(write_log)
+        read_conn = fake_connection(read_log, pages)
+        with patch("async_loader.connect", AsyncMock(side_effect=[write_conn, read_conn])), \
+                patch("async_loader.encode", side_effect=encode), \
+                patch("async_loader.get_default_cache", return_value=None):
+            stats = async_loader.generate_embeddings("test_table", batch_size=2, commit_every=2)
+        return stats, write_conn, read_conn, write_log
+
+    def test_pages_are_copied_and_committed(self):
+        pages = [[(str(i), "x" * (10 - i)) for i in range(4)], [("4", "x")]]
+        stats, write_conn, read_conn, log = self.run_pipeline(
+            pages, lambda texts, batch_size: np.ones((len(texts), 3), dtype="float32")
+        )
+
+        # Pages of 4 and 1 rows -> 3 COPYs, shortest descriptions first, one commit per page
+        self.assertEqual(log, [
+            "begin", ("copy", ["3", "2"]), ("copy", ["1", "0"]), "commit",
+            "begin", ("copy", ["4"]), "commit"
+        ])
+        self.assertEqual(stats["rows"], 5)
+        self.assertEqual(stats["failed"], 0)
+
+        query = read_conn.cursor.call_args.args[0]
+        self.assertIn('SELECT "sysdocid"::text, description FROM "test_table"', query)
+        update = [c.args[0] for c in write_conn.execute.call_args_list if "UPDATE" in c.args[0]][0]
+        self.assertIn('t."sysdocid" = s.id::integer', update)
+        write_conn.set_type_codec.assert_awaited_once()
+        write_conn.close.assert_awaited_once()
+        read_conn.close.assert_awaited_once()
+
+    def test_failed_encode_rolls_back_only_its_page(self):
+        calls = []
+
+        def encode(texts, batch_size):
+            calls.append(texts)
+            if len(calls) == 2:
+                raise RuntimeError("model error")
+            return np.ones((len(texts), 3), dtype="float32")
+
+        pages = [[("1", "a"), ("2", "b"), ("3", "c"), ("4", "d")], [("5", "e")]]
+        stats, _, _, log = self.run_pipeline(pages, encode)
+
+        self.assertEqual(log, [
+            "begin", ("copy", ["1", "2"]), "rollback",
+            "begin", ("copy", ["5"]), "commit"
+        ])
+        self.assertEqual(stats["rows"], 1)
+        self.assertEqual(stats["failed"], 4)
+
+    def test_connect_kwargs_follow_db_settings(self):
+        env = {"DB_HOST": "db", "DB_PORT": "5433", "DB_USERNAME": "etl", "DB_PASSWORD": "pw", "DB_NAME": "etl"}
+        with patch.dict("os.environ", env), \
+                patch.dict(async_loader.config, {"db_statement_timeout": "15min", "db_connect_timeout": "5"}):
+            kwargs = async_loader.connect_kwargs()
+        self.assertEqual(kwargs["port"], 5433)
+        self.assertEqual(kwargs["database"], "etl")
+        self.assertEqual(kwargs["server_settings"], {"statement_timeout": "15min"})
+        self.assertEqual(kwargs["timeout"], 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import pdfplumber
+import pandas as pd
+import benchmark
+
+class TestBenchmarkHarness(unittest.TestCase):
+
+    def test_synthetic_pdf_has_a_text_layer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = benchmark.synthetic_pdf(os.path.join(tmp, "book.pdf"), pages=3, lines_per_page=5)
+            with pdfplumber.open(path) as pdf:
+                texts = [page.extract_text() for page in pdf.pages]
+
+        self.assertEqual(len(texts), 3)
+        self.assertTrue(texts[2].startswith("Invoice book page 3"))
+        self.assertEqual(len(texts[0].splitlines()), 5)
+
+    def test_load_benchmark_runs_offline(self):
+        result = benchmark.bench_load(1000, repeat=1, batch_size=300)
+        self.assertEqual(result["mode"], "client")
+        self.assertGreater(result["mb_per_sec"], 0)
+
+    def test_load_frame_matches_the_live_table_types(self):
+        df = benchmark.load_frame(2000)
+        self.assertIn('"batchreferenceid" bigint', benchmark.load_table_ddl())
+        self.assertIn('"sysdocid" bigint', benchmark.load_table_ddl())
+
+        copied = pd.read_csv(io.StringIO(df.to_csv(index=False)), dtype=str, keep_default_na=False)
+        for col in ("SysDocID", "BatchReferenceID"):
+            self.assertTrue(copied[col].str.fullmatch(r"\d+").all(), col)
+        # Missing batch ids took the config default
+        self.assertIn("0", set(copied["BatchReferenceID"]))
+
+    def test_runs_are_compared_on_matching_results(self):
+        old = {"results": [
+            {"stage": "transform", "rows": 1000, "seconds": 2.0, "rows_per_sec": 500},
+            {"stage": "transform", "rows": 5000, "seconds": 4.0}
+        ]}
+        new = {"results": [{"stage": "transform", "rows": 1000, "seconds": 1.0, "rows_per_sec": 1000}]}
+        rows = benchmark.compare_records(old, new)
+
+        self.assertEqual([(r["field"], r["old"], r["new"], r["change"]) for r in rows], [
+            ("seconds", 2.0, 1.0, -0.5), ("rows_per_sec", 500, 1000, 1.0)
+        ])
+        self.assertEqual(rows[0]["key"], {"stage": "transform", "rows": 1000})
+
+    def test_results_file_records_the_commit(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.jsonl")
+            benchmark.append_record(path, benchmark.run_record("transform", {"rows": "1000"}, [{"stage": "transform"}]))
+            benchmark.append_record(path, benchmark.run_record("transform", {"rows": "1000"}, []))
+            records = benchmark.load_records(path)
+
+        self.assertEqual(len(records), 2)
+        # None only when the checkout is not a git repository
+        self.assertIn(len(records[0]["commit"] or "x" * 40), (40, 64))
+        self.assertEqual(records[0]["results"], [{"stage": "transform"}])
+
+    @patch("benchmark.run_stage", return_value=[])
+    def test_embedding_stage_is_capped(self, mock_run):
+        with patch("sys.argv", ["benchmark.py", "embedding", "--rows", "1000,100000,10000000"]):
+            benchmark.main()
+        self.assertEqual([c.args[2] for c in mock_run.call_args_list], [1000, benchmark.EMBEDDING_MAX_ROWS])
+
+if __name__ == "__main__":
+    unittest.main()
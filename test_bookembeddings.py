@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+import faiss
+import numpy as np
+import pandas as pd
+import bookembeddings
+
+def fake_pdf(texts):
+    pdf = MagicMock()
+    pdf.__enter__.return_value = pdf
+    pdf.pages = []
+    for text in texts:
+        page = MagicMock()
+        page.extract_text.return_value = text
+        pdf.pages.append(page)
+    return pdf
+
+class TestPageExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pdf_path = os.path.join(self.tmp.name, "book.pdf")
+        with open(self.pdf_path, 'wb') as f:
+            f.write(b"%PDF-1.4 fake")
+        self.cache_dir = os.path.join(self.tmp.name, "ocr_cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def records(self, pdf):
+        with patch("bookembeddings.pdfplumber.open", return_value=pdf):
+            return list(bookembeddings.iter_page_records(self.pdf_path, dpi=150, workers=1, cache_dir=self.cache_dir))
+
+    @patch("bookembeddings.pytesseract.image_to_string", return_value="scanned text")
+    def test_pages_in_order_with_ocr_fallback(self, mock_ocr):
+        texts = [f"page {i}" for i in range(1, 21)]
+        texts[4] = "  "
+        records = self.records(fake_pdf(texts))
+
+        self.assertEqual([r["page"] for r in records], list(range(1, 21)))
+        self.assertEqual(records[4]["text"], "scanned text")
+        self.assertEqual(records[4]["method"], "ocr")
+        self.assertEqual(records[0]["method"], "text")
+        mock_ocr.assert_called_once()
+
+    @patch("bookembeddings.pytesseract.image_to_string", return_value="scanned text")
+    def test_rerun_is_served_from_cache(self, mock_ocr):
+        first = self.records(fake_pdf(["a", "", "c"]))
+        pdf = fake_pdf(["a", "", "c"])
+        second = self.records(pdf)
+
+        self.assertEqual([r["text"] for r in second], [r["text"] for r in first])
+        self.assertTrue(all(r["cached"] for r in second))
+        self.assertEqual(mock_ocr.call_count, 1)
+        for page in pdf.pages:
+            page.extract_text.assert_not_called()
+
+    def test_quality_tier_and_override(self):
+        with patch("bookembeddings.config", {"ocr_quality": "draft"}):
+            self.assertEqual(bookembeddings.get_ocr_dpi(), 150)
+        with patch("bookembeddings.config", {"ocr_quality": "draft", "ocr_dpi": "200"}):
+            self.assertEqual(bookembeddings.get_ocr_dpi(), 200)
+        with patch("bookembeddings.config", {"ocr_quality": "ultra"}):
+            self.assertRaises(ValueError, bookembeddings.get_ocr_dpi)
+
+def fake_encode(texts, batch_size):
+    return np.array([[float(len(t)), 1.0] for t in texts], dtype="float32")
+
+class TestStreamingBookEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, "book_embeddings.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch("bookembeddings.encode", side_effect=fake_encode)
+    def test_batches_cross_page_boundaries(self, mock_encode):
+        # Pages of 1, 3 and 2 chunks; with batch_size 4 every call but the last is full.
+        pages = iter([(1, "a" * 100), (2, "b" * 1500), (3, "c" * 900)])
+        rows, index, df = bookembeddings.build_index(pages, self.output, batch_size=4)
+
+        self.assertEqual([len(c.args[0]) for c in mock_encode.call_args_list], [4, 2])
+        self.assertEqual(rows, 6)
+        self.assertEqual(index.ntotal, 6)
+        self.assertIsNone(df)
+
+        written = pd.read_csv(self.output)
+        self.assertEqual(list(written.columns), bookembeddings.BOOK_COLUMNS)
+        self.assertEqual(list(zip(written["page"], written["chunk_idx"])),
+                         [(1, 0), (2, 0), (2, 1), (2, 2), (3, 0), (3, 1)])
+
+        # Vectors are stored as float32 .npy rows in the same order as the chunk file
+        vecs = np.load(os.path.join(self.tmp.name, "book_embeddings.npy"), mmap_mode="r")
+        self.assertEqual(vecs.dtype, np.float32)
+        self.assertEqual(vecs[:, 0].tolist(), written["text"].str.len().tolist())
+
+    @patch("bookembeddings.encode", side_effect=fake_encode)
+    def test_keep_frames_returns_the_chunk_frame(self, mock_encode):
+        rows, index, df = bookembeddings.build_index([(1, "short page")], self.output, keep_frames=True)
+        self.assertEqual(df[["page", "chunk_idx", "text"]].values.tolist(), [[1, 0, "short page"]])
+        self.assertEqual(df["embedding"][0].tolist(), [10.0, 1.0])
+
+def unit_vectors(n, dim=16, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+class TestBookIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.tmp.name, "book_index.faiss")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        bookembeddings._indexes.clear()
+
+    def test_ivf_buffers_until_trained(self):
+        builder = bookembeddings.IndexBuilder("ivf", nlist=4, train_size=200)
+        vecs = unit_vectors(300)
+        builder.add([f"id{i}" for i in range(100)], vecs[:100])
+        self.assertIsNone(builder.index)
+        builder.add([f"id{i}" for i in range(100, 300)], vecs[100:])
+
+        index = builder.finish()
+        self.assertEqual(index.ntotal, 300)
+        self.assertEqual(faiss.extract_index_ivf(index).nlist, 4)
+
+    def test_small_book_falls_back_to_flat(self):
+        self.assertEqual(bookembeddings.index_spec("ivfpq", 768, 50, 1024), "Flat")
+        self.assertEqual(bookembeddings.index_spec("ivfpq", 768, 100, 1024), "IVF2,Flat")
+        self.assertEqual(bookembeddings.index_spec("ivfpq", 768, 100000, 1024), "IVF1024,PQ48")
+
+    def test_saved_index_is_searchable_by_chunk_id(self):
+        vecs = unit_vectors(50)
+        ids = [f"chunk-{i}" for i in range(50)]
+        builder = bookembeddings.IndexBuilder("hnsw")
+        builder.add(ids, vecs)
+        bookembeddings.save_index(builder.finish(), builder.ids, self.index_path)
+
+        with patch("bookembeddings.encode", return_value=vecs[[7, 31]]):
+            results = bookembeddings.search(["q1", "q2"], k=3, index_path=self.index_path)
+        self.assertEqual([hits[0][0] for hits in results], ["chunk-7", "chunk-31"])
+        self.assertAlmostEqual(results[0][0][1], 1.0, places=4)
+
+        with patch("bookembeddings.encode", return_value=vecs[[7]]):
+            self.assertEqual(bookembeddings.search("q1", k=1, index_path=self.index_path)[0][0], "chunk-7")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import psycopg2.extensions
+import db_connect
+
+ENV = {
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_USERNAME": "user",
+    "DB_PASSWORD": "pass",
+    "DB_NAME": "testdb"
+}
+
+def fake_connection(*args, **kwargs):
+    conn = MagicMock()
+    conn.closed = 0
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+@patch.dict("os.environ", ENV)
+class TestConnectionPool(unittest.TestCase):
+
+    def tearDown(self):
+        db_connect.close_pool()
+
+    @patch("psycopg2.connect", side_effect=fake_connection)
+    def test_released_connection_is_reused(self, mock_connect):
+        with patch("db_connect.config", {}):
+            first = db_connect.get_connection()
+            db_connect.release_connection(first)
+            with db_connect.pg_connection() as second:
+                self.assertIs(second, first)
+            self.assertIs(db_connect.get_connection(), first)
+
+        mock_connect.assert_called_once_with(
+            host="localhost", port="5432", user="user", password="pass", dbname="testdb"
+        )
+        first.close.assert_not_called()
+
+    @patch("psycopg2.connect", side_effect=fake_connection)
+    def test_timeouts_only_sent_when_configured(self, mock_connect):
+        with patch("db_connect.config", {"db_statement_timeout": "15min", "db_connect_timeout": "5"}):
+            db_connect.get_connection()
+        kwargs = mock_connect.call_args.kwargs
+        self.assertEqual(kwargs["options"], "-c statement_timeout=15min")
+        self.assertEqual(kwargs["connect_timeout"], 5)
+
+    @patch("psycopg2.connect", side_effect=fake_connection)
+    def test_broken_idle_connection_is_replaced(self, mock_connect):
+        with patch("db_connect.config", {"db_health_check_after": "0"}):
+            first = db_connect.get_connection()
+            db_connect.release_connection(first)
+            first.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError
+            second = db_connect.get_connection()
+
+        self.assertIsNot(second, first)
+        self.assertEqual(mock_connect.call_count, 2)
+        first.close.assert_called_once()
+
+    def test_foreign_connection_is_closed(self):
+        conn = MagicMock()
+        db_connect.release_connection(conn)
+        conn.close.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
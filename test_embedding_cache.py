@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from embedding_cache import EmbeddingCache, encode_with_cache, text_key
+
+def fake_model():
+    model = MagicMock()
+    model.encode.side_effect = lambda texts, **kwargs: np.array(
+        [[len(t), 1.0] for t in texts], dtype="float32"
+    )
+    return model
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_ignores_whitespace_but_not_model(self):
+        self.assertEqual(text_key("m", "Invoice  from\nVendor A "), text_key("m", "Invoice from Vendor A"))
+        self.assertNotEqual(text_key("m", "Invoice"), text_key("other", "Invoice"))
+
+    def test_second_run_is_served_from_cache(self):
+        # Duplicates within a call are encoded once, and a re-run never reaches the model.
+        model = fake_model()
+        cache = EmbeddingCache(self.path)
+        first = encode_with_cache(model, "m", ["a", "bb", "a"], 32, cache)
+        self.assertEqual(model.encode.call_args.args[0], ["a", "bb"])
+        self.assertEqual(cache.stats()["misses"], 3)
+        cache.close()
+
+        model = fake_model()
+        cache = EmbeddingCache(self.path)
+        second = encode_with_cache(model, "m", ["bb", "a"], 32, cache)
+        model.encode.assert_not_called()
+        np.testing.assert_array_equal(second, first[[1, 0]])
+        self.assertEqual(cache.stats()["hits"], 2)
+        cache.close()
+
+    def test_lru_eviction(self):
+        # The least recently used entries are dropped once max_entries is exceeded.
+        model = fake_model()
+        cache = EmbeddingCache(self.path, max_entries=2)
+        encode_with_cache(model, "m", ["a"], 32, cache)
+        encode_with_cache(model, "m", ["b"], 32, cache)
+        encode_with_cache(model, "m", ["a"], 32, cache)
+        encode_with_cache(model, "m", ["c"], 32, cache)
+        self.assertEqual(cache.stats()["entries"], 2)
+
+        model.encode.reset_mock()
+        encode_with_cache(model, "m", ["a", "c"], 32, cache)
+        model.encode.assert_not_called()
+        encode_with_cache(model, "m", ["b"], 32, cache)
+        self.assertEqual(model.encode.call_args.args[0], ["b"])
+        cache.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,14 @@
+import os
+import tempfile
 import unittest
+from unittest.mock import MagicMock, patch
 import pandas as pd
-from extraction import load_config, get_requested_fields
+from extraction import (
+    load_config, get_requested_fields, build_query, fetch_batches,
+    partition_predicates, extract_partitioned, extract_data, watermark_predicate
+)
+from extract_state import get_watermark
+from frame_io import write_csv_batches
 
 class TestETLExtraction(unittest.TestCase):
 
@@ -44,6 +52,110 @@ class TestExtractedData(unittest.TestCase):
             self.assertIn(col, self.df.columns)
             self.assertFalse(self.df[col].isnull().any(), f"Null values found in {col}")
 
+
+class TestStreamingExtraction(unittest.TestCase):
+
+    def test_build_query_limit_is_optional(self):
+        # The row limit is only applied when one is configured.
+        self.assertEqual(build_query(["A", "b"], "etl_data"), "SELECT a, b FROM etl_data")
+        self.assertEqual(build_query(["a"], "etl_data", "9"), "SELECT a FROM etl_data LIMIT 9")
+        self.assertEqual(
+            build_query(["a"], "etl_data", "9", "a >= 3", "a"),
+            "SELECT a FROM etl_data WHERE a >= 3 ORDER BY a LIMIT 9"
+        )
+
+    def test_fetch_batches_uses_fetchmany(self):
+        # Rows are pulled in fixed-size batches until the cursor is exhausted.
+        cursor = MagicMock()
+        cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,)], []]
+        batches = list(fetch_batches(cursor, 2))
+        self.assertEqual(batches, [[(1,), (2,)], [(3,)]])
+        cursor.fetchmany.assert_called_with(2)
+        cursor.fetchall.assert_not_called()
+
+    def test_write_csv_batches_writes_header_once(self):
+        # Batches are appended to one CSV with a single header row.
+        batches = [pd.DataFrame({"a": [1, 2]}), pd.DataFrame({"a": [3]})]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.csv")
+            total = write_csv_batches(iter(batches), path, ["a"])
+            self.assertEqual(total, 3)
+            self.assertEqual(pd.read_csv(path)["a"].tolist(), [1, 2, 3])
+
+    def test_write_csv_batches_empty_result(self):
+        # An empty result still produces a CSV with the requested columns.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.csv")
+            self.assertEqual(write_csv_batches(iter([]), path, ["a", "b"]), 0)
+            self.assertEqual(pd.read_csv(path).columns.tolist(), ["a", "b"])
+
+class TestPartitionedExtraction(unittest.TestCase):
+
+    def test_partition_predicates_cover_key_range(self):
+        # Ranges are contiguous, cover [lo, hi] and the first one also takes NULL keys.
+        predicates = partition_predicates("sourcedocumentid", 1001, 1010, 3)
+        self.assertEqual(predicates, [
+            "(sourcedocumentid >= 1001 AND sourcedocumentid < 1004) OR sourcedocumentid IS NULL",
+            "sourcedocumentid >= 1004 AND sourcedocumentid < 1007",
+            "sourcedocumentid >= 1007 AND sourcedocumentid < 1011",
+        ])
+
+    def test_partition_predicates_small_or_empty_range(self):
+        # Never more partitions than keys, and an empty table gets a single unfiltered pull.
+        self.assertEqual(len(partition_predicates("id", 5, 6, 8)), 2)
+        self.assertEqual(partition_predicates("id", None, None, 4), [None])
+
+    @patch("extraction.stream_extract")
+    def test_extract_partitioned_merges_parts_in_order(self, mock_stream):
+        # Each predicate is pulled separately and the parts are merged with one header.
+        mock_stream.side_effect = lambda fields, batch_size, where=None: iter(
+            [pd.DataFrame({"id": [int(where.strip("()"))]})]
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "extracted.csv")
+            cfg = {"extracted_path": path, "extract_workers": "2"}
+            outputs = extract_partitioned(["id"], cfg, predicates=["1", "2", "3"])
+            self.assertEqual(outputs, [path])
+            self.assertEqual(pd.read_csv(path)["id"].tolist(), [1, 2, 3])
+            self.assertEqual(os.listdir(tmp), ["extracted.csv"])
+
+class TestIncrementalExtraction(unittest.TestCase):
+
+    def test_watermark_predicate(self):
+        # Numeric watermarks compare as numbers, anything else as a quoted literal.
+        self.assertIsNone(watermark_predicate("sourcedocumentid", None))
+        self.assertEqual(watermark_predicate("sourcedocumentid", 1005), "sourcedocumentid >= 1005")
+        self.assertEqual(watermark_predicate("cmodloaddate", "2023-07-02"), "cmodloaddate >= '2023-07-02'")
+
+    @patch.dict("os.environ", {"DB_TABLE": "etl_data"})
+    @patch("extraction.stream_extract")
+    def test_extract_data_advances_watermark(self, mock_stream):
+        # The first run pulls everything; the next run filters on the saved high-water mark.
+        mock_stream.return_value = iter([pd.DataFrame({"sourcedocumentid": [1001, 1003]}),
+                                         pd.DataFrame({"sourcedocumentid": [1002]})])
+        with tempfile.TemporaryDirectory() as tmp:
+            state = os.path.join(tmp, "state.json")
+            cfg = {
+                "extracted_path": os.path.join(tmp, "out.csv"),
+                "extract_watermark_column": "SourceDocumentID",
+                "extract_state_file": state
+            }
+            extract_data(["sourcedocumentid"], cfg)
+            self.assertIsNone(mock_stream.call_args[0][3])
+            self.assertEqual(get_watermark("etl_data.sourcedocumentid", state), 1003)
+
+            mock_stream.return_value = iter([])
+            extract_data(["sourcedocumentid"], cfg)
+            self.assertEqual(mock_stream.call_args[0][3], "sourcedocumentid >= 1003")
+            self.assertIsNone(mock_stream.call_args[0][4])
+            self.assertEqual(get_watermark("etl_data.sourcedocumentid", state), 1003)
+
+            # With a row limit the pull is ordered on the watermark column
+            cfg["extract_limit"] = "500"
+            mock_stream.return_value = iter([])
+            extract_data(["sourcedocumentid"], cfg)
+            self.assertEqual(mock_stream.call_args[0][4], "sourcedocumentid")
+
 if __name__ == "__main__":
     unittest.main()
 
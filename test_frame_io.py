@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from frame_io import detect_format, read_columns, read_frame, iter_frames, write_batches, merge_parts
+
+class TestFrameIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_detect_format_from_extension(self):
+        self.assertEqual(detect_format("extracted_data.parquet"), "parquet")
+        self.assertEqual(detect_format("EXTRACTED.PQ"), "parquet")
+        self.assertEqual(detect_format("extracted_data.csv"), "csv")
+
+    def test_parquet_batches_keep_schema_when_first_batch_is_null(self):
+        # A column that is all-null in the first batch must still accept text later.
+        path = self.path("out.parquet")
+        batches = [
+            pd.DataFrame({"id": [1, 2], "title": [None, None]}),
+            pd.DataFrame({"id": [3], "title": ["Invoice"]})
+        ]
+        self.assertEqual(write_batches(iter(batches), path, ["id", "title"]), 3)
+        self.assertEqual(read_columns(path), ["id", "title"])
+        df = read_frame(path, columns=["title"])
+        self.assertEqual(df.columns.tolist(), ["title"])
+        self.assertEqual(df["title"].tolist()[2], "Invoice")
+        self.assertEqual([len(chunk) for chunk in iter_frames(path, 2)], [2, 1])
+
+    def test_parquet_schema_widens_for_later_batches(self):
+        # Ints in a column that was all-null, and a fraction in an int column, both fit.
+        path = self.path("out.parquet")
+        batches = [
+            pd.DataFrame({"id": [1, 2], "batch": [None, None], "amount": [10, 20]}),
+            pd.DataFrame({"id": [3], "batch": [501], "amount": [30]}),
+            pd.DataFrame({"id": [4], "batch": [502], "amount": [12.5]})
+        ]
+        self.assertEqual(write_batches(iter(batches), path, ["id", "batch", "amount"]), 4)
+        df = read_frame(path)
+        self.assertEqual(df["batch"].tolist()[2:], [501, 502])
+        self.assertTrue(pd.api.types.is_integer_dtype(df["id"]))
+        self.assertEqual(df["amount"].tolist(), [10.0, 20.0, 30.0, 12.5])
+        self.assertEqual(os.listdir(self.tmp.name), ["out.parquet"])
+
+    def test_parquet_conflicting_types_fall_back_to_text(self):
+        path = self.path("out.parquet")
+        batches = [pd.DataFrame({"code": [1, 2]}), pd.DataFrame({"code": ["A3"]})]
+        write_batches(iter(batches), path, ["code"])
+        self.assertEqual(read_frame(path)["code"].tolist(), ["1", "2", "A3"])
+
+    def test_merge_parts(self):
+        # Parts merge in order, for both formats.
+        for ext in ("csv", "parquet"):
+            parts = []
+            for i, ids in enumerate([[1, 2], [3]]):
+                part = self.path(f"part{i}.{ext}")
+                write_batches(iter([pd.DataFrame({"id": ids})]), part, ["id"])
+                parts.append(part)
+            merged = self.path(f"merged.{ext}")
+            merge_parts(parts, merged)
+            self.assertEqual(read_frame(merged)["id"].tolist(), [1, 2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,20 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open, MagicMock
+import numpy as np
+import pandas as pd
 import loader
+import db_connect
+from vector_io import iter_copy_rows
 
 class TestPostgresCSVLoader(unittest.TestCase):
 
-    @patch("loader.psycopg2.connect")
+    def tearDown(self):
+        db_connect.close_pool()
+
+    @patch("db_connect.config", {})
+    @patch("db_connect.psycopg2.connect")
     @patch.dict("os.environ", {
         "DB_HOST": "localhost",
         "DB_PORT": "5432",
@@ -26,7 +36,8 @@ class TestPostgresCSVLoader(unittest.TestCase):
             dbname="testdb"
         )
 
-    @patch("loader.psycopg2.connect", side_effect=Exception("Connection failed"))
+    @patch("db_connect.config", {})
+    @patch("db_connect.psycopg2.connect", side_effect=Exception("Connection failed"))
     @patch.dict("os.environ", {
         "DB_HOST": "localhost",
         "DB_PORT": "5432",
@@ -60,6 +71,142 @@ class TestPostgresCSVLoader(unittest.TestCase):
             loader.load_csv_to_postgres("dummy.csv", "test_table")
         self.assertIn("DB error", str(context.exception))
 
+    @patch("loader.get_pg_connection")
+    def test_load_csv_to_postgres_merge_mode(self, mock_get_conn):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = [("sysdocid",), ("description",), ("embedding",)]
+        mock_cursor.fetchone.return_value = (1,)
+        mock_conn.cursor.return_value = mock_cursor
+        mock_get_conn.return_value = mock_conn
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "data.csv")
+            with open(path, "w") as f:
+                f.write("SysDocID,Description\n1,Invoice\n")
+            loader.load_csv_to_postgres(path, "test_table", mode="merge", key="sysdocid")
+
+        statements = [c.args[0] for c in mock_cursor.execute.call_args_list]
+        self.assertFalse(any("DELETE FROM" in sql for sql in statements))
+        self.assertFalse(any("CREATE UNIQUE INDEX" in sql for sql in statements))
+        self.assertIn('COPY "test_table_staging"', mock_cursor.copy_expert.call_args.args[0])
+        merge_sql = statements[-1]
+        self.assertIn('ON CONFLICT ("sysdocid")', merge_sql)
+        self.assertIn("THEN NULL ELSE t.embedding END", merge_sql)
+        mock_conn.commit.assert_called_once()
+
+    @patch("loader.get_pg_connection")
+    def test_incremental_extract_is_never_loaded_in_replace_mode(self, mock_get_conn):
+        with patch.dict(loader.config, {"extract_watermark_column": "sourcedocumentid", "load_mode": None}):
+            for mode in (None, "replace"):
+                with self.assertRaises(ValueError) as context:
+                    loader.load_into_table(MagicMock(), "test_table", ["sysdocid"], mode=mode)
+                self.assertIn("LOAD_MODE=merge", str(context.exception))
+        mock_get_conn.assert_not_called()
+
+    @patch("loader.get_pg_connection")
+    def test_merge_mode_requires_unique_key(self, mock_get_conn):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_cursor.fetchone.return_value = None
+        mock_conn.cursor.return_value = mock_cursor
+        mock_get_conn.return_value = mock_conn
+
+        with self.assertRaises(ValueError) as context:
+            loader.load_into_table(MagicMock(), "test_table", ["sysdocid"], mode="merge", key="sysdocid")
+        self.assertIn("unique index", str(context.exception))
+        self.assertFalse(any("CREATE" in c.args[0] for c in mock_cursor.execute.call_args_list))
+        mock_conn.commit.assert_not_called()
+
+    def test_build_merge_query_without_embedding_column(self):
+        sql = loader.build_merge_query("t", "t_staging", ["sysdocid", "title"], "sysdocid", {"sysdocid", "title"})
+        self.assertIn('"title" = EXCLUDED."title"', sql)
+        self.assertNotIn("embedding", sql)
+        self.assertIn("IS DISTINCT FROM", sql)
+
+    @patch("loader.get_default_cache", return_value=None)
+    @patch("model_registry.get_default_cache", return_value=None)
+    @patch("loader.ensure_embedding_column")
+    @patch("model_registry.get_model")
+    @patch("loader.get_pg_connection")
+    def test_generate_embeddings_pages_batches_and_commits(self, mock_get_conn, mock_get_model, *_):
+        write_conn = MagicMock()
+        write_cursor = write_conn.cursor.return_value.__enter__.return_value
+        write_cursor.fetchall.return_value = [("sysdocid",), ("description",), ("embedding",)]
+        write_cursor.fetchone.return_value = ("integer",)
+        payloads = []
+        write_cursor.copy_expert.side_effect = lambda sql, f: payloads.append(
+            list(iter_copy_rows(f, ["text", "vector"]))
+        )
+        read_conn = MagicMock()
+        read_cursor = read_conn.cursor.return_value.__enter__.return_value
+        read_cursor.fetchmany.side_effect = [
+            [(i, "x" * (10 - i)) for i in range(4)],
+            [(4, "x")],
+            []
+        ]
+        mock_get_conn.side_effect = [write_conn, read_conn]
+        mock_model = mock_get_model.return_value
+        mock_model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 3), dtype="float32")
+
+        loader.generate_embeddings("test_table", batch_size=2, commit_every=2)
+
+        # Only the id and description are read, through a named cursor paged at batch_size * commit_every
+        self.assertEqual(read_conn.cursor.call_args.kwargs["name"], "embedding_rows")
+        query = read_cursor.execute.call_args.args[0]
+        self.assertIn('SELECT "sysdocid", description FROM "test_table"', query)
+        read_cursor.fetchmany.assert_called_with(4)
+        read_cursor.fetchall.assert_not_called()
+
+        # Pages of 4 and 1 rows -> 3 encode calls and 3 binary COPYs, shortest descriptions first
+        self.assertEqual(mock_model.encode.call_count, 3)
+        self.assertEqual(len(payloads), 3)
+        self.assertEqual([row[0] for row in payloads[0]], ["3", "2"])
+        self.assertEqual(payloads[0][0][1].tolist(), [1.0, 1.0, 1.0])
+
+        # The staged text id is cast to the key's type in the UPDATE
+        update = [c.args[0] for c in write_cursor.execute.call_args_list if "UPDATE" in c.args[0]][0]
+        self.assertIn('t."sysdocid" = s.id::integer', update)
+
+        # One commit for the staging table (so a rolled-back page cannot drop it),
+        # one per page, and both connections are closed
+        self.assertEqual(write_conn.commit.call_count, 3)
+        write_conn.close.assert_called_once()
+        read_conn.close.assert_called_once()
+
+    @patch("loader.get_pg_connection")
+    def test_load_book_chunks_copies_rows_and_links_documents(self, mock_get_conn):
+        conn = mock_get_conn.return_value
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = ("book_key",)
+        payloads = []
+        cursor.copy_expert.side_effect = lambda sql, f: payloads.append(
+            list(iter_copy_rows(f, ["uuid", "text", "int4", "int4", "text", "vector"]))
+        )
+        ids = ["6a1f1d7e-2f7b-4a59-9a43-5b3e0f0c1a2b", "0b8c7a52-4e2d-4c07-b3a9-2d1f6c9e8a11"]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            chunks_path = os.path.join(tmp, "book_embeddings.csv")
+            pd.DataFrame({"id": ids, "page": [1, 2], "chunk_idx": [0, 0], "text": ["first", "second"]}) \
+                .to_csv(chunks_path, index=False)
+            np.save(os.path.join(tmp, "book_embeddings.npy"), np.array([[1, 0], [0, 1]], dtype="float32"))
+
+            loader.load_book_chunks("test_table", chunks_path, "invoice_book.pdf")
+
+        statements = [c.args[0] for c in cursor.execute.call_args_list]
+        self.assertTrue(any("DELETE FROM book_chunks WHERE book_key" in sql for sql in statements))
+        self.assertTrue(any('UPDATE "test_table" SET book_key' in sql for sql in statements))
+        self.assertTrue(any("USING hnsw" in sql for sql in statements))
+
+        rows = payloads[0]
+        self.assertEqual([row[:5] for row in rows], [
+            (ids[0], "invoice_book.pdf", 1, 0, "first"),
+            (ids[1], "invoice_book.pdf", 2, 0, "second")
+        ])
+        self.assertEqual(rows[1][5].tolist(), [0.0, 1.0])
+        conn.commit.assert_called()
+        conn.close.assert_called_once()
+
     @patch("loader.load_csv_to_postgres")
     @patch.dict("os.environ", {"DEST_TABLE": "test_table"})
     @patch("loader.config", {"transformation_path": "dummy.csv"})
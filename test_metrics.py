@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+from unittest.mock import patch, mock_open
+import metrics
+
+class TestStageMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def stage_report(self):
+        return {s["stage"]: s for s in metrics.report()["stages"]}
+
+    def test_nested_stage_time_is_excluded_from_parent_self_time(self):
+        def produce():
+            for n in (2, 3):
+                time.sleep(0.02)
+                yield list(range(n))
+
+        with metrics.stage("load") as load:
+            for batch in metrics.timed_iter("extract", produce()):
+                load.rows += len(batch)
+                time.sleep(0.01)
+
+        stages = self.stage_report()
+        self.assertEqual(stages["extract"]["rows"], 5)
+        # Two batches plus the final StopIteration
+        self.assertEqual(stages["extract"]["calls"], 3)
+        self.assertEqual(stages["load"]["rows"], 5)
+        self.assertGreaterEqual(stages["load"]["seconds"], 0.06)
+        self.assertLess(stages["load"]["self_seconds"], stages["load"]["seconds"] - 0.035)
+        self.assertGreater(stages["load"]["peak_rss_mb"], 0)
+
+    def test_decorator_counts_calls_and_rows(self):
+        @metrics.timed("transform", rows=len)
+        def transform(items):
+            return items * 2
+
+        transform([1])
+        transform([1, 2])
+        metrics.count("transform", nbytes=100)
+
+        stats = self.stage_report()["transform"]
+        self.assertEqual((stats["calls"], stats["rows"], stats["bytes"]), (2, 6, 100))
+
+    def test_histogram_summary_and_buckets(self):
+        for value in (0.002, 0.03, 0.03, 0.2, 4.0):
+            metrics.observe("encode_batch_seconds", value)
+
+        hist = metrics.report()["histograms"]["encode_batch_seconds"]
+        self.assertEqual(hist["count"], 5)
+        self.assertEqual(hist["p50"], 0.03)
+        self.assertEqual(hist["max"], 4.0)
+        self.assertEqual(hist["buckets"]["0.05"], 3)
+        self.assertEqual(hist["buckets"]["60"], 5)
+
+    def test_histogram_memory_is_bounded(self):
+        hist = metrics.Histogram("encode_batch_seconds", reservoir_size=100)
+        for i in range(10000):
+            hist.observe(i / 1000)
+
+        self.assertEqual(len(hist.reservoir), 100)
+        stats = hist.as_dict()
+        self.assertEqual((stats["count"], stats["min"], stats["max"]), (10000, 0.0, 9.999))
+        self.assertEqual(stats["buckets"]["1"], 1001)
+        self.assertEqual(stats["buckets"]["60"], 10000)
+        self.assertTrue(0 <= stats["p50"] <= 9.999)
+
+    def test_rss_units_and_unreadable_statm(self):
+        usage = type("Usage", (), {"ru_maxrss": 2000000})()
+        with patch("metrics.resource.getrusage", return_value=usage):
+            with patch("metrics.sys.platform", "darwin"):
+                self.assertEqual(metrics.peak_rss_mb(), 2.0)
+            with patch("metrics.sys.platform", "linux"):
+                self.assertEqual(metrics.peak_rss_mb(), 2000.0)
+                with patch("builtins.open", mock_open(read_data="")):
+                    self.assertEqual(metrics.current_rss_mb(), 2000.0)
+
+    def test_finish_run_writes_report_and_textfile(self):
+        with metrics.stage("embeddings") as stats:
+            stats.rows += 10
+        metrics.observe("encode_batch_seconds", 0.1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            report_path = os.path.join(tmp, "run_report.json")
+            textfile = os.path.join(tmp, "etl.prom")
+            with patch.dict(metrics.config, {"metrics_report": report_path, "metrics_textfile": textfile}):
+                metrics.finish_run()
+
+            with open(report_path) as f:
+                report = json.load(f)
+            with open(textfile) as f:
+                prom = f.read()
+
+        self.assertEqual(report["stages"][0]["stage"], "embeddings")
+        self.assertEqual(report["stages"][0]["rows"], 10)
+        self.assertIn("run_id", report)
+        self.assertIn('etl_stage_rows{stage="embeddings"} 10', prom)
+        self.assertIn('etl_encode_batch_seconds_bucket{le="0.1"} 1', prom)
+        self.assertIn('etl_encode_batch_seconds_bucket{le="+Inf"} 1', prom)
+        self.assertIn("etl_encode_batch_seconds_count 1", prom)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+import numpy as np
+import model_registry
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        model_registry._models.clear()
+        model_registry._load_stats.clear()
+
+    def test_model_is_loaded_once_on_first_use(self):
+        # Importing does not construct a model; the first get_model does, later calls reuse it.
+        fake_module = MagicMock()
+        with patch.dict(sys.modules, {"sentence_transformers": fake_module}), \
+                patch("model_registry.config", {"embed_device": "cpu"}):
+            first = model_registry.get_model("some/model")
+            second = model_registry.get_model("some/model")
+
+        self.assertIs(first, second)
+        fake_module.SentenceTransformer.assert_called_once_with("some/model", device="cpu")
+        self.assertIn("seconds", model_registry.get_load_stats()["some/model"])
+
+    def test_onnx_backend_options(self):
+        fake_module = MagicMock()
+        cfg = {"embed_backend": "onnx", "embed_model_file": "onnx/model_qint8_avx512_vnni.onnx"}
+        with patch.dict(sys.modules, {"sentence_transformers": fake_module}), \
+                patch("model_registry.config", cfg):
+            model_registry.get_model("some/model")
+
+        fake_module.SentenceTransformer.assert_called_once_with(
+            "some/model", device=None, backend="onnx",
+            model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"}
+        )
+
+    def test_stub_backend_needs_no_model(self):
+        # EMBED_BACKEND=stub never imports sentence_transformers and is deterministic.
+        with patch.dict(sys.modules, {"sentence_transformers": None}), \
+                patch("model_registry.config", {"embed_backend": "stub"}):
+            model = model_registry.get_model("some/model")
+        vecs = model.encode(["invoice from vendor a", "invoice from vendor a", ""], batch_size=2)
+
+        self.assertEqual(vecs.shape, (3, model_registry.STUB_DIM))
+        np.testing.assert_array_equal(vecs[0], vecs[1])
+        self.assertAlmostEqual(float(np.linalg.norm(vecs[0])), 1.0, places=5)
+        self.assertFalse(vecs[2].any())
+
+    def test_cache_key_separates_backends_and_quantization(self):
+        keys = set()
+        for cfg in ({}, {"embed_backend": "stub"}, {"embed_backend": "onnx"},
+                    {"embed_backend": "onnx", "embed_model_file": "onnx/model_qint8_avx512_vnni.onnx"},
+                    {"embed_quantize": "1"}):
+            with patch("model_registry.config", cfg):
+                keys.add(model_registry.cache_model_key("some/model"))
+        self.assertEqual(len(keys), 5)
+        # Full-precision torch keeps the plain model name, so existing caches stay valid
+        with patch("model_registry.config", {}):
+            self.assertEqual(model_registry.cache_model_key("some/model"), "some/model")
+
+    def test_stub_vectors_are_cached_under_their_own_key(self):
+        cache = MagicMock()
+        cache.get_many.return_value = {}
+        with patch("model_registry.config", {"embed_backend": "stub"}), \
+                patch("model_registry.get_default_cache", return_value=cache):
+            model_registry.encode(["invoice"], 8, name="some/model")
+        model_key = cache.put_many.call_args.args[0]
+        self.assertTrue(model_key.startswith("some/model|stub|"))
+
+    def test_pooled_encoder_keeps_input_order(self):
+        # Shards come back in submission order, so output row i belongs to texts[i].
+        fake_model = MagicMock()
+        fake_model.encode.side_effect = lambda texts, **kwargs: np.array([[float(t)] for t in texts])
+        texts = [str(i) for i in range(10)]
+        with ThreadPoolExecutor(max_workers=3) as pool, \
+                patch("model_registry.get_pool", return_value=pool), \
+                patch("model_registry.get_model", return_value=fake_model):
+            out = model_registry.PooledEncoder("some/model", workers=3).encode(texts, batch_size=4)
+
+        self.assertEqual(out[:, 0].tolist(), list(range(10)))
+        self.assertEqual([len(c.args[0]) for c in fake_model.encode.call_args_list], [4, 4, 2])
+
+    def test_get_encoder_uses_pool_when_configured(self):
+        with patch("model_registry.config", {"embed_workers": "4", "embed_worker_threads": "2"}):
+            encoder = model_registry.get_encoder("some/model")
+        self.assertIsInstance(encoder, model_registry.PooledEncoder)
+        self.assertEqual((encoder.workers, encoder.threads), (4, 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import gzip
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+import pandas as pd
+import pg_export
+from vector_io import PGCOPY_HEADER, PGCOPY_TRAILER, encode_field
+
+TABLE_COLUMNS = [("sysdocid", 23), ("description", 25), ("scandate", 1082), ("embedding", 16385)]
+
+def fake_cursor(csv_text, columns=TABLE_COLUMNS, vectors=()):
+    cur = MagicMock()
+    executed = []
+
+    def execute(sql, params=None):
+        executed.append(sql)
+        # Projected columns when the query names them, else the whole table
+        cur.description = [(name, oid) for name, oid in columns if f'"{name}"' in sql] or list(columns)
+    cur.execute.side_effect = execute
+
+    def copy_expert(sql, f):
+        executed.append(sql)
+        if "FORMAT binary" in sql:
+            f.write(PGCOPY_HEADER)
+            for doc_id, vec in vectors:
+                f.write(b"\x00\x02" + encode_field(doc_id, "text") + encode_field(vec, "vector"))
+            f.write(PGCOPY_TRAILER)
+        else:
+            f.write(csv_text.encode("utf-8"))
+        cur.rowcount = csv_text.count("\n") - 1
+    cur.copy_expert.side_effect = copy_expert
+    return cur, executed
+
+CSV_TEXT = 'sysdocid,description,scandate\n1,Invoice,2023-01-05\n2,"",\n'
+
+class TestCopyExport(unittest.TestCase):
+
+    def test_table_export_excludes_embedding_and_writes_npy(self):
+        cur, executed = fake_cursor(CSV_TEXT, vectors=[("1", [0.5, 1.0])])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.csv")
+            rows, vectors = pg_export.export_table(cur, "loader_table", path, embedding="npy", id_col="sysdocid")
+
+            self.assertEqual((rows, vectors), (2, 1))
+            with open(path) as f:
+                self.assertEqual(f.read(), CSV_TEXT)
+            np.testing.assert_array_equal(np.load(os.path.join(tmp, "export.npy")), [[0.5, 1.0]])
+
+        copy = [sql for sql in executed if sql.startswith("COPY") and "csv" in sql][0]
+        self.assertIn('SELECT "sysdocid", "description", "scandate" FROM "loader_table"', copy)
+        self.assertIn("TO STDOUT WITH (FORMAT csv, HEADER)", copy)
+
+    def test_projection_and_text_embedding(self):
+        cur, executed = fake_cursor(CSV_TEXT)
+        with tempfile.TemporaryDirectory() as tmp:
+            pg_export.export_table(cur, "t", os.path.join(tmp, "a.csv"), columns=["sysdocid", "embedding"], embedding="text")
+            self.assertFalse(os.path.exists(os.path.join(tmp, "a.npy")))
+        copy = [sql for sql in executed if sql.startswith("COPY")][0]
+        self.assertIn('SELECT "sysdocid", "embedding" FROM "t"', copy)
+
+        with self.assertRaises(ValueError):
+            pg_export.get_embedding_mode("json")
+
+    def test_gzip_export(self):
+        cur, _ = fake_cursor(CSV_TEXT)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.csv.gz")
+            pg_export.export_query(cur, "SELECT 1", path)
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(f.read(), CSV_TEXT)
+        self.assertEqual(pg_export.vectors_path("out/export.csv.gz"), "out/export.npy")
+
+    def test_parquet_export_keeps_types_and_nulls(self):
+        cur, _ = fake_cursor(CSV_TEXT)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.parquet")
+            pg_export.export_query(cur, 'SELECT "sysdocid", "description", "scandate" FROM t', path)
+            df = pd.read_parquet(path)
+
+        self.assertEqual(str(df["sysdocid"].dtype), "int32")
+        self.assertEqual(df["description"].tolist(), ["Invoice", ""])
+        self.assertEqual(str(df["scandate"][0]), "2023-01-05")
+        self.assertTrue(pd.isna(df["scandate"][1]))
+
+    def test_parquet_export_with_multiline_values_across_blocks(self):
+        text = "first line\nsecond line\n\nthird line " + "x" * 40
+        rows = "".join(f'{i},"{text}",2023-01-05\n' for i in range(200))
+        cur, _ = fake_cursor("sysdocid,description,scandate\n" + rows)
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch("pg_export.PARQUET_BLOCK_SIZE", 1000):
+            path = os.path.join(tmp, "export.parquet")
+            pg_export.export_query(cur, 'SELECT "sysdocid", "description", "scandate" FROM t', path)
+            df = pd.read_parquet(path)
+
+        self.assertEqual(df["sysdocid"].tolist(), list(range(200)))
+        self.assertTrue((df["description"] == text).all())
+
+if __name__ == "__main__":
+    unittest.main()
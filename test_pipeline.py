@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+import pipeline
+
+CONFIG_DF = pd.DataFrame({
+    "Source FieldName": ["sourcedocumentid", "scandate"],
+    "Target FieldName": ["SysDocID", "ScanDate"],
+    "Target DataType": ["int", "date"],
+    "Target Default Value": ["", ""]
+})
+
+class TestPipeline(unittest.TestCase):
+
+    def run_with_batches(self, cfg, checkpoint):
+        loaded = []
+
+        def fake_load(frames, table_name, columns):
+            loaded.extend(frames)
+            self.assertEqual(columns, ["SysDocID", "ScanDate"])
+
+        batches = [
+            pd.DataFrame({"sourcedocumentid": [1001, 1002], "scandate": ["2023-07-01", "2023-07-02"]}),
+            pd.DataFrame({"sourcedocumentid": [1003], "scandate": ["2023-07-03"]})
+        ]
+        with patch("pipeline.config", cfg), \
+                patch("pipeline.update_etl_config"), \
+                patch("pipeline.load_extraction_config"), \
+                patch("pipeline.get_requested_fields", return_value=["sourcedocumentid", "scandate"]), \
+                patch("pipeline.load_transformation_config", return_value=CONFIG_DF), \
+                patch("pipeline.extract_batches", return_value=(None, iter(batches))), \
+                patch("pipeline.load_frames_to_postgres", side_effect=fake_load), \
+                patch("pipeline.run_post_load_steps") as post_load:
+            pipeline.run_pipeline(checkpoint=checkpoint)
+            post_load.assert_called_once()
+        return loaded
+
+    def test_batches_flow_without_intermediate_files(self):
+        # Transformed batches reach the loader and nothing is written to disk.
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = {
+                "config_file": "etl_config.csv",
+                "extracted_path": os.path.join(tmp, "extracted.csv"),
+                "transformation_path": os.path.join(tmp, "transformed.csv")
+            }
+            loaded = self.run_with_batches(cfg, checkpoint=False)
+            self.assertEqual(os.listdir(tmp), [])
+        self.assertEqual(sum(len(df) for df in loaded), 3)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(loaded[0]["ScanDate"]))
+
+    def test_checkpoint_writes_intermediate_files(self):
+        # With checkpointing on, both stage outputs are written while the batches flow.
+        with tempfile.TemporaryDirectory() as tmp:
+            cfg = {
+                "config_file": "etl_config.csv",
+                "extracted_path": os.path.join(tmp, "extracted.csv"),
+                "transformation_path": os.path.join(tmp, "transformed.csv")
+            }
+            self.run_with_batches(cfg, checkpoint=True)
+            self.assertEqual(len(pd.read_csv(cfg["extracted_path"])), 3)
+            self.assertEqual(pd.read_csv(cfg["transformation_path"]).columns.tolist(), ["SysDocID", "ScanDate"])
+
+if __name__ == "__main__":
+    unittest.main()
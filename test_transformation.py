@@ -1,6 +1,10 @@
+import os
+import tempfile
 import unittest
 import pandas as pd
-from transformation import load_config, load_extracted_data, transform_data
+from transformation import (
+    load_config, load_extracted_data, transform_data, compile_plan, parse_dates, transform_in_chunks
+)
 
 class TestETLTransformationRealFiles(unittest.TestCase):
 
@@ -70,5 +74,68 @@ class TestETLTransformationRealFiles(unittest.TestCase):
                     f"Column '{col}' is not string dtype"
                 )
 
+
+class TestTransformationPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.config_df = pd.DataFrame({
+            "Source FieldName": ["title", "scandate", "batchreferenceid"],
+            "Target FieldName": ["Title", "ScanDate", "BatchReferenceID"],
+            "Target DataType": ["string", "date", "int"],
+            "Target Default Value": ["Untitled", "", "0"]
+        })
+
+    def test_compile_plan(self):
+        # The config is compiled into whole-frame fill, cast and rename steps.
+        plan = compile_plan(self.config_df, "%Y-%m-%d")
+        self.assertEqual(plan["fill"], {"title": "Untitled", "batchreferenceid": "0"})
+        self.assertEqual(plan["dates"], ["scandate"])
+        self.assertEqual(plan["strings"], ["title"])
+        self.assertEqual(plan["rename"]["scandate"], "ScanDate")
+
+    def test_transform_with_plan(self):
+        # Fills, casts and renames are applied in one pass and invalid dates become NaT.
+        df = pd.DataFrame({
+            "title": ["Invoice", None],
+            "scandate": ["2023-07-01", "not a date"],
+            "batchreferenceid": [501, None],
+            "extra": [1, 2]
+        })
+        out = transform_data(df, self.config_df, compile_plan(self.config_df, "%Y-%m-%d"))
+        self.assertEqual(out.columns.tolist(), ["Title", "ScanDate", "BatchReferenceID", "extra"])
+        self.assertEqual(out["Title"].tolist(), ["Invoice", "Untitled"])
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(out["ScanDate"]))
+        self.assertTrue(pd.isna(out["ScanDate"].iloc[1]))
+        self.assertFalse(out["BatchReferenceID"].isnull().any())
+
+    def test_parse_dates_keeps_index_and_missing_values(self):
+        # Each distinct value is parsed once and the results keep the frame's index.
+        values = pd.Series(["2023-07-01", None, "2023-07-01"], index=[10, 11, 12])
+        parsed = parse_dates(values, "%Y-%m-%d")
+        self.assertEqual(parsed.index.tolist(), [10, 11, 12])
+        self.assertEqual(parsed.iloc[0], pd.Timestamp("2023-07-01"))
+        self.assertTrue(pd.isna(parsed.iloc[1]))
+
+    def test_transform_in_chunks_matches_types_across_chunks(self):
+        # Chunks are appended with one header and every chunk gets the same column types.
+        plan = compile_plan(self.config_df, "%Y-%m-%d")
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "extracted.csv")
+            target = os.path.join(tmp, "transformed.csv")
+            pd.DataFrame({
+                "Title": ["a", None, "c", "d", "e"],
+                "ScanDate": ["2023-07-01", None, None, "2023-07-04", "bad"],
+                "BatchReferenceID": [501, 502, None, 504, 505]
+            }).to_csv(source, index=False)
+
+            total = transform_in_chunks(source, target, plan, chunksize=2)
+            self.assertEqual(total, 5)
+
+            out = pd.read_csv(target, parse_dates=["ScanDate"])
+            self.assertEqual(out.columns.tolist(), ["Title", "ScanDate", "BatchReferenceID"])
+            self.assertEqual(out["Title"].tolist(), ["a", "Untitled", "c", "d", "e"])
+            self.assertEqual(out["BatchReferenceID"].tolist(), [501, 502, 0, 504, 505])
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(out["ScanDate"]))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,52 @@
+import io
+import os
+import struct
+import tempfile
+import unittest
+import numpy as np
+from vector_io import copy_payload, iter_copy_rows, encode_vector, NpyWriter, write_vectors, open_vectors
+
+class TestVectorIO(unittest.TestCase):
+
+    def test_pgvector_binary_layout(self):
+        data = encode_vector([1.0, -2.5])
+        self.assertEqual(data, struct.pack("!hh", 2, 0) + struct.pack("!ff", 1.0, -2.5))
+
+    def test_copy_payload_round_trips(self):
+        vecs = np.array([[0.5, 1.5], [2.0, -1.0]], dtype="float32")
+        payload = copy_payload(
+            [["a", None], [1, 2], ["6a1f1d7e-2f7b-4a59-9a43-5b3e0f0c1a2b"] * 2, vecs],
+            ["text", "int4", "uuid", "vector"]
+        )
+        self.assertTrue(payload.getvalue().startswith(b"PGCOPY\n\xff\r\n\x00"))
+
+        rows = list(iter_copy_rows(payload, ["text", "int4", "uuid", "vector"]))
+        self.assertEqual([row[:3] for row in rows], [
+            ("a", 1, "6a1f1d7e-2f7b-4a59-9a43-5b3e0f0c1a2b"),
+            (None, 2, "6a1f1d7e-2f7b-4a59-9a43-5b3e0f0c1a2b")
+        ])
+        np.testing.assert_array_equal(np.stack([row[3] for row in rows]), vecs)
+
+    def test_truncated_stream_is_rejected(self):
+        payload = copy_payload([["a"]], ["text"]).getvalue()[:-4]
+        with self.assertRaises(ValueError):
+            list(iter_copy_rows(io.BytesIO(payload), ["text"]))
+
+    def test_npy_writer_appends_and_memory_maps(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "vectors.npy")
+            with NpyWriter(path, 3) as writer:
+                writer.write(np.ones((2, 3)))
+                writer.write(np.zeros((1, 3)))
+            vecs = open_vectors(path)
+            self.assertEqual(vecs.shape, (3, 3))
+            self.assertEqual(vecs.dtype, np.float32)
+            self.assertIsInstance(vecs, np.memmap)
+
+            count = write_vectors(((i, np.full(3, i)) for i in range(5)), path, batch_size=2)
+            self.assertEqual(count, 5)
+            self.assertEqual(open_vectors(path)[:, 0].tolist(), [0, 1, 2, 3, 4])
+            self.assertEqual(np.load(os.path.join(tmp, "vectors.ids.npy")).tolist(), ["0", "1", "2", "3", "4"])
+
+if __name__ == "__main__":
+    unittest.main()
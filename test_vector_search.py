@@ -0,0 +1,75 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+import vector_search
+
+class TestVectorSearch(unittest.TestCase):
+
+    def test_default_lists_follows_row_count(self):
+        self.assertEqual(vector_search.default_lists(500), 1)
+        self.assertEqual(vector_search.default_lists(200000), 200)
+        self.assertEqual(vector_search.default_lists(4000000), 2000)
+
+    def test_create_hnsw_index_replaces_existing(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = [("loader_table_embedding_ivfflat",)]
+        with patch("vector_search.config", {}):
+            name = vector_search.create_index(conn, "loader_table", method="hnsw", m=24, ef_construction=100)
+
+        statements = [c.args[0] for c in cur.execute.call_args_list]
+        self.assertEqual(name, "loader_table_embedding_hnsw")
+        self.assertIn('DROP INDEX IF EXISTS "loader_table_embedding_ivfflat"', statements)
+        create = [sql for sql in statements if "CREATE INDEX" in sql][0]
+        self.assertIn('USING hnsw ("embedding" vector_ip_ops) WITH (m = 24, ef_construction = 100)', create)
+        conn.commit.assert_called_once()
+
+    def test_ivfflat_lists_sized_from_rows(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.fetchall.return_value = []
+        cur.fetchone.return_value = (50000,)
+        with patch("vector_search.config", {}):
+            vector_search.create_index(conn, "book_chunks", method="ivfflat", metric="cosine")
+        create = [c.args[0] for c in cur.execute.call_args_list if "CREATE INDEX" in c.args[0]][0]
+        self.assertIn('USING ivfflat ("embedding" vector_cosine_ops) WITH (lists = 50)', create)
+
+    def test_search_many_runs_one_lateral_query_with_per_query_params(self):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.description = [("ord",), ("id",), ("distance",)]
+        cur.fetchall.return_value = [(1, 1001, -0.9), (1, 1002, -0.5), (2, 1003, -0.8)]
+
+        with patch("vector_search.config", {}):
+            results = vector_search.search_many(
+                np.eye(3, dtype="float32")[:2], k=2, filters={"batchreferenceid": [501, 502]}, conn=conn
+            )
+
+        self.assertEqual(results, [
+            [{"id": 1001, "distance": -0.9}, {"id": 1002, "distance": -0.5}],
+            [{"id": 1003, "distance": -0.8}]
+        ])
+        statements = [c.args for c in cur.execute.call_args_list]
+        self.assertEqual(statements[0], ("SET LOCAL hnsw.ef_search = %s", (40,)))
+        self.assertEqual(statements[1], ("SET LOCAL ivfflat.probes = %s", (10,)))
+        sql, params = statements[2]
+        self.assertIn("CROSS JOIN LATERAL", sql)
+        self.assertIn('t."batchreferenceid" = ANY(%s)', sql)
+        self.assertIn('ORDER BY t."embedding" <#> q.vec::vector', sql)
+        self.assertEqual(params, [["[1,0,0]", "[0,1,0]"], [501, 502], 2])
+        conn.close.assert_not_called()
+
+    @patch("vector_search.encode", return_value=np.ones((1, 2), dtype="float32"))
+    def test_search_encodes_text_queries(self, mock_encode):
+        conn = MagicMock()
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.description = [("ord",), ("id",), ("distance",)]
+        cur.fetchall.return_value = []
+        with patch("vector_search.config", {"vector_ef_search": "5"}):
+            self.assertEqual(vector_search.search("invoice from vendor a", k=20, conn=conn), [])
+        mock_encode.assert_called_once_with(["invoice from vendor a"], vector_search.QUERY_BATCH_SIZE)
+        # ef_search is never below k
+        self.assertEqual(cur.execute.call_args_list[0].args[1], (20,))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import numpy as np
+import vectordb
+from vector_io import iter_copy_rows
+
+def connections(pages, column_type="vector(3)"):
+    write_conn = MagicMock()
+    write_cursor = write_conn.cursor.return_value.__enter__.return_value
+    write_cursor.fetchone.return_value = (column_type,)
+    payloads = []
+    write_cursor.copy_expert.side_effect = lambda sql, f: payloads.append(
+        list(iter_copy_rows(f, ["int8", "text", "vector"]))
+    )
+    read_conn = MagicMock()
+    read_conn.cursor.return_value.__enter__.return_value.fetchmany.side_effect = pages + [[]]
+    return write_conn, read_conn, payloads
+
+class TestVectorDBEmbeddings(unittest.TestCase):
+
+    @patch("vectordb.encode", side_effect=lambda texts, batch_size: np.ones((len(texts), 3), dtype="float32"))
+    @patch("vectordb.get_connection")
+    def test_batches_are_copied_and_committed_periodically(self, mock_get_conn, mock_encode):
+        write_conn, read_conn, payloads = connections([
+            [(1001, "a"), (1002, None)], [(1003, "c"), (1004, "d")], [(1005, "e")]
+        ])
+        mock_get_conn.side_effect = [write_conn, read_conn]
+
+        vectordb.generate_embeddings(batch_size=2, commit_every=2)
+
+        self.assertEqual(mock_encode.call_count, 3)
+        self.assertEqual(mock_encode.call_args_list[0].args[0], ["a", ""])
+        self.assertEqual([[row[:2] for row in p] for p in payloads], [
+            [(1001, "a"), (1002, None)], [(1003, "c"), (1004, "d")], [(1005, "e")]
+        ])
+        # Staging table setup, one commit after 4 rows, and the final commit
+        self.assertEqual(write_conn.commit.call_count, 3)
+        write_conn.close.assert_called_once()
+        read_conn.close.assert_called_once()
+
+    @patch("vectordb.encode", side_effect=lambda texts, batch_size: np.ones((len(texts), 1536), dtype="float32"))
+    @patch("vectordb.get_connection")
+    def test_dimension_mismatch_is_rejected_before_writing(self, mock_get_conn, _):
+        write_conn, read_conn, payloads = connections([[(1001, "a")]], column_type="vector(768)")
+        mock_get_conn.side_effect = [write_conn, read_conn]
+
+        with self.assertRaises(ValueError) as ctx:
+            vectordb.generate_embeddings()
+        self.assertIn("vector(768)", str(ctx.exception))
+        self.assertEqual(payloads, [])
+        write_conn.rollback.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 import pandas as pd
 import logging
 from config_paths import config
+from frame_io import read_frame, read_columns, iter_frames, write_frame, write_batches
+import metrics
 
 # Set up logging
 logging.basicConfig(
@@ -24,9 +26,8 @@ def load_config(path):
         df["Target DataType"] = df["Target DataType"].astype(str).str.strip().str.lower()
 
         # Replace empty Target FieldNames with the corresponding Target Default Values
-        df["Target FieldName"] = df.apply(
-            lambda row: row["Target Default Value"] if row["Target FieldName"] == "" else row["Target FieldName"],
-            axis=1
+        df["Target FieldName"] = df["Target FieldName"].mask(
+            df["Target FieldName"] == "", df["Target Default Value"]
         )
 
         # Drop rows where Target FieldName or DataType is still missing after fallback
@@ -41,51 +42,109 @@ def load_config(path):
 
 def load_extracted_data(path):
     try:
-        df = pd.read_csv(path)
+        df = read_frame(path)
         df.columns = df.columns.str.strip().str.lower()
         return df
     except Exception as e:
         logging.error(f"Failed to load extracted data: {e}")
         raise
 
-def transform_data(df, config_df):
+# Compiles the config into a plan (fills, casts, date columns, renames) once,
+# so every frame or chunk is transformed with a handful of whole-frame operations
+def compile_plan(config_df, date_format=None):
+    source_to_target = dict(zip(config_df["Source FieldName"], config_df["Target FieldName"]))
+    data_type_map = dict(zip(config_df["Source FieldName"], config_df["Target DataType"]))
+    default_value_map = dict(zip(config_df["Source FieldName"], config_df["Target Default Value"]))
+
+    return {
+        "rename": source_to_target,
+        "fill": {col: val for col, val in default_value_map.items() if val != ""},
+        "dates": [col for col, dtype in data_type_map.items() if dtype == "date"],
+        "strings": [col for col, dtype in data_type_map.items() if dtype == "string"],
+        "date_format": date_format
+    }
+
+# Parses each distinct value once and broadcasts the result back to the rows;
+# extracts repeat the same few thousand dates across millions of rows
+def parse_dates(values, date_format=None):
+    # Already typed, e.g. read back from Parquet
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    codes, uniques = pd.factorize(values)
+    parsed = pd.DatetimeIndex(pd.to_datetime(uniques, errors='coerce', format=date_format))
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index)
+
+def apply_plan(df, plan):
+    for source_col in plan["rename"]:
+        if source_col not in df.columns:
+            logging.warning(f"Column '{source_col}' not found in data. Skipping.")
+
+    # Fill missing values where a default is provided
+    fill = {col: val for col, val in plan["fill"].items() if col in df.columns}
+    if fill:
+        df = df.fillna(fill)
+
+    # Type conversion
+    strings = [col for col in plan["strings"] if col in df.columns]
+    if strings:
+        df = df.astype({col: str for col in strings})
+
+    dates = [col for col in plan["dates"] if col in df.columns]
+    if dates:
+        df = df.assign(**{col: parse_dates(df[col], plan["date_format"]) for col in dates})
+
+    # Rename columns that exist in the data
+    rename_map = {col: target for col, target in plan["rename"].items() if col in df.columns}
+    return df.rename(columns=rename_map)
+
+@metrics.timed("transform", rows=len)
+def transform_data(df, config_df, plan=None):
     try:
-        source_to_target = dict(zip(config_df["Source FieldName"], config_df["Target FieldName"]))
-        data_type_map = dict(zip(config_df["Source FieldName"], config_df["Target DataType"]))
-        default_value_map = dict(zip(config_df["Source FieldName"], config_df["Target Default Value"]))
-
-        for source_col, target_col in source_to_target.items():
-            if source_col not in df.columns:
-                logging.warning(f"Column '{source_col}' not found in data. Skipping.")
-                continue
-
-            # Fill missing values if default is provided
-            default_val = default_value_map.get(source_col)
-            if default_val != "":
-                df[source_col] = df[source_col].fillna(default_val)
-
-            # Type conversion
-            dtype = data_type_map.get(source_col, "")
-            if dtype == "date":
-                df[source_col] = pd.to_datetime(df[source_col], errors='coerce')
-            elif dtype == "string":
-                df[source_col] = df[source_col].astype(str)
-
-        # Rename columns that exist in the data
-        existing_cols = [col for col in source_to_target if col in df.columns]
-        rename_map = {col: source_to_target[col] for col in existing_cols}
-        df = df.rename(columns=rename_map)
-
-        return df
+        if plan is None:
+            plan = compile_plan(config_df, config.get("date_format"))
+        return apply_plan(df, plan)
     except Exception as e:
         logging.error(f"Error during transformation: {e}")
         raise
 
+# Streams the extract through the plan chunk by chunk, so peak memory depends on
+# chunksize rather than file size. CSV chunks are read as text so pandas never
+# infers a different dtype for the same column in different chunks; date and
+# string columns then get their types from the plan.
+def transform_in_chunks(input_path, output_path, plan, chunksize):
+    def transformed_chunks():
+        total = 0
+        for chunk in iter_frames(input_path, chunksize):
+            chunk.columns = chunk.columns.str.strip().str.lower()
+            total += len(chunk)
+            logging.info(f"Transformed {total} rows...")
+            with metrics.stage("transform") as stats:
+                transformed = apply_plan(chunk, plan)
+                stats.rows += len(transformed)
+            yield transformed
+
+    try:
+        columns = [col.strip().lower() for col in read_columns(input_path)]
+        output_columns = [plan["rename"].get(col, col) for col in columns]
+        return write_batches(transformed_chunks(), output_path, output_columns)
+    except Exception as e:
+        logging.error(f"Error during chunked transformation: {e}")
+        raise
+
 def main():
     config_df = load_config(config["config_file"])
+    plan = compile_plan(config_df, config.get("date_format"))
+    output_path = config.get("transformation_path") or "transformed_data.csv"
+
+    chunksize = config.get("transform_chunk_size")
+    if chunksize:
+        total = transform_in_chunks(config["extracted_path"], output_path, plan, int(chunksize))
+        logging.info(f"Transformation complete. {total} rows transformed.")
+        return
+
     df = load_extracted_data(config["extracted_path"])
-    transformed_df = transform_data(df, config_df)
-    transformed_df.to_csv("transformed_data.csv", index=False)
+    transformed_df = transform_data(df, config_df, plan)
+    write_frame(transformed_df, output_path)
     logging.info("Transformation complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import io
+import os
+import uuid
+import struct
+import tempfile
+import numpy as np
+
+# Binary formats for embeddings, so vectors never round-trip through text:
+# PostgreSQL binary COPY (pgvector's send/recv format) for the database, and
+# .npy float32 files (memory-mappable with np.load(mmap_mode="r")) on disk.
+
+PGCOPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+PGCOPY_HEADER = PGCOPY_SIGNATURE + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+NULL_FIELD = struct.pack("!i", -1)
+
+# Column kinds understood by copy_payload / iter_copy_rows
+FIELD_KINDS = ("text", "int4", "int8", "uuid", "vector")
+
+# pgvector's binary representation: int16 dim, int16 unused, dim big-endian float32s
+def encode_vector(vec):
+    arr = np.asarray(vec, dtype=">f4")
+    return struct.pack("!hh", len(arr), 0) + arr.tobytes()
+
+def decode_vector(data):
+    dim, _ = struct.unpack_from("!hh", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype("float32")
+
+def encode_field(value, kind):
+    if value is None:
+        return NULL_FIELD
+    if kind == "text":
+        data = str(value).encode("utf-8")
+    elif kind == "int4":
+        data = struct.pack("!i", int(value))
+    elif kind == "int8":
+        data = struct.pack("!q", int(value))
+    elif kind == "uuid":
+        data = uuid.UUID(str(value)).bytes
+    elif kind == "vector":
+        data = encode_vector(value)
+    else:
+        raise ValueError(f"Unsupported COPY field kind '{kind}', expected one of {FIELD_KINDS}")
+    return struct.pack("!i", len(data)) + data
+
+def decode_field(data, kind):
+    if kind == "text":
+        return data.decode("utf-8")
+    if kind == "int4":
+        return struct.unpack("!i", data)[0]
+    if kind == "int8":
+        return struct.unpack("!q", data)[0]
+    if kind == "uuid":
+        return str(uuid.UUID(bytes=data))
+    if kind == "vector":
+        return decode_vector(data)
+    raise ValueError(f"Unsupported COPY field kind '{kind}', expected one of {FIELD_KINDS}")
+
+# Builds a COPY ... FROM STDIN (FORMAT binary) payload from parallel column sequences.
+# Vector columns are converted to big-endian float32 once for the whole batch.
+def copy_payload(columns, kinds):
+    columns = [
+        np.ascontiguousarray(col, dtype=">f4") if kind == "vector" else col
+        for col, kind in zip(columns, kinds)
+    ]
+    field_count = struct.pack("!h", len(columns))
+
+    buf = io.BytesIO()
+    buf.write(PGCOPY_HEADER)
+    for row in zip(*columns):
+        buf.write(field_count)
+        for value, kind in zip(row, kinds):
+            buf.write(encode_field(value, kind))
+    buf.write(PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated binary COPY stream")
+    return data
+
+# Parses the output of COPY ... TO STDOUT (FORMAT binary), one tuple at a time
+def iter_copy_rows(f, kinds):
+    if _read_exact(f, len(PGCOPY_SIGNATURE)) != PGCOPY_SIGNATURE:
+        raise ValueError("Not a binary COPY stream")
+    _, extension_length = struct.unpack("!ii", _read_exact(f, 8))
+    _read_exact(f, extension_length)
+
+    while True:
+        (field_count,) = struct.unpack("!h", _read_exact(f, 2))
+        if field_count == -1:
+            return
+        row = []
+        for kind in kinds[:field_count]:
+            (length,) = struct.unpack("!i", _read_exact(f, 4))
+            row.append(None if length == -1 else decode_field(_read_exact(f, length), kind))
+        yield tuple(row)
+
+# Streams COPY (query) TO STDOUT (FORMAT binary) through a temporary file and yields the rows
+def copy_rows_out(cur, query, kinds):
+    with tempfile.TemporaryFile() as spool:
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", spool)
+        spool.seek(0)
+        yield from iter_copy_rows(spool, kinds)
+
+# Appends float32 rows to a .npy file without knowing the row count up front.
+# The header is written with a fixed width and rewritten with the final shape on close.
+class NpyWriter:
+    HEADER_SIZE = 128
+
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        self.rows = 0
+        self.f = open(path, 'wb')
+        self.f.write(self._header())
+
+    def _header(self):
+        header = repr({"descr": "<f4", "fortran_order": False, "shape": (self.rows, self.dim)})
+        # 8 magic bytes + 2 length bytes, then the dict padded with spaces and ended by a newline
+        header = header.ljust(self.HEADER_SIZE - 10 - 1) + "\n"
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+    def write(self, vecs):
+        vecs = np.ascontiguousarray(vecs, dtype="<f4")
+        if vecs.ndim != 2 or vecs.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got shape {vecs.shape}")
+        self.f.write(vecs.tobytes())
+        self.rows += len(vecs)
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.f.seek(0)
+        self.f.write(self._header())
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def ids_path(npy_path):
+    return f"{os.path.splitext(npy_path)[0]}.ids.npy"
+
+# Writes (id, vector) rows to <path> (float32 matrix) and <path>.ids.npy in batches;
+# returns the number of rows written
+def write_vectors(rows, path, batch_size=10000):
+    writer = None
+    ids = []
+    batch = []
+    try:
+        for doc_id, vec in rows:
+            if writer is None:
+                writer = NpyWriter(path, len(vec))
+            ids.append(str(doc_id))
+            batch.append(vec)
+            if len(batch) == batch_size:
+                writer.write(np.stack(batch))
+                batch = []
+        if batch:
+            writer.write(np.stack(batch))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        np.save(path, np.empty((0, 0), dtype="float32"))
+    np.save(ids_path(path), np.array(ids, dtype=str))
+    return len(ids)
+
+# Memory-maps a .npy matrix written by NpyWriter / write_vectors
+def open_vectors(path):
+    return np.load(path, mmap_mode="r")
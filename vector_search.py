@@ -0,0 +1,205 @@
+import math
+import argparse
+import json
+import logging
+import numpy as np
+from config_paths import config
+from db_connect import get_connection, release_connection
+from model_registry import encode
+
+# pgvector ANN indexes and nearest-neighbour search over any table with a vector column:
+# loader_table (sysdocid, embedding), etl_embeddings (sourcedocumentid, embedding)
+# and book_chunks (id, embedding). The metric must match between index and query;
+# embeddings are normalized, so inner product is the default.
+METRICS = {
+    "ip": ("<#>", "vector_ip_ops"),
+    "cosine": ("<=>", "vector_cosine_ops"),
+    "l2": ("<->", "vector_l2_ops"),
+}
+INDEX_METHODS = ("hnsw", "ivfflat")
+
+DEFAULT_M = 16
+DEFAULT_EF_CONSTRUCTION = 64
+DEFAULT_EF_SEARCH = 40
+DEFAULT_PROBES = 10
+QUERY_BATCH_SIZE = 64
+
+def get_metric(metric=None):
+    metric = (metric or config.get("vector_metric") or "ip").lower()
+    if metric not in METRICS:
+        raise ValueError(f"Unknown VECTOR_METRIC '{metric}', expected one of {sorted(METRICS)}")
+    return metric
+
+def index_name(table_name, column, method):
+    return f"{table_name}_{column}_{method}".lower()
+
+# pgvector's guidance for IVFFlat: rows / 1000 lists up to 1M rows, sqrt(rows) above
+def default_lists(rows):
+    if rows <= 1000000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+# Builds an HNSW or IVFFlat index on table.column. Any index of the other method or
+# metric on the same column is dropped first, so there is one ANN index per column.
+def create_index(conn, table_name, column="embedding", method=None, metric=None,
+                 m=None, ef_construction=None, lists=None):
+    method = (method or config.get("vector_index_method") or "hnsw").lower()
+    if method not in INDEX_METHODS:
+        raise ValueError(f"Unknown VECTOR_INDEX_METHOD '{method}', expected one of {INDEX_METHODS}")
+    _, opclass = METRICS[get_metric(metric)]
+    name = index_name(table_name, column, method)
+
+    with conn.cursor() as cur:
+        for existing in list_indexes(cur, table_name, column):
+            logging.info(f"Dropping index {existing} on {table_name}.{column}")
+            cur.execute(f'DROP INDEX IF EXISTS "{existing}"')
+
+        if config.get("vector_maintenance_work_mem"):
+            # Graph / list builds are much faster when they fit in memory
+            cur.execute("SET LOCAL maintenance_work_mem = %s", (config["vector_maintenance_work_mem"],))
+
+        if method == "hnsw":
+            m = int(m or config.get("vector_index_m") or DEFAULT_M)
+            ef_construction = int(ef_construction or config.get("vector_index_ef_construction") or DEFAULT_EF_CONSTRUCTION)
+            options = f"m = {m}, ef_construction = {ef_construction}"
+        else:
+            if not lists and not config.get("vector_index_lists"):
+                # IVFFlat centroids come from the rows present at build time
+                cur.execute(f'SELECT count(*) FROM "{table_name}" WHERE "{column}" IS NOT NULL')
+                lists = default_lists(cur.fetchone()[0])
+            lists = int(lists or config["vector_index_lists"])
+            options = f"lists = {lists}"
+
+        cur.execute(f'''
+            CREATE INDEX "{name}" ON "{table_name}"
+            USING {method} ("{column}" {opclass}) WITH ({options})
+        ''')
+        cur.execute(f'ANALYZE "{table_name}"')
+    conn.commit()
+    logging.info(f"Created {method} index {name} ({opclass}, {options}).")
+    return name
+
+def list_indexes(cur, table_name, column="embedding"):
+    cur.execute("""
+        SELECT i.relname
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_am am ON am.oid = i.relam
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = ANY(x.indkey)
+        WHERE x.indrelid = %s::regclass AND a.attname = %s AND am.amname IN ('hnsw', 'ivfflat')
+    """, (f'"{table_name}"', column))
+    return [row[0] for row in cur.fetchall()]
+
+# Rebuilds the ANN indexes on a column, e.g. after a large load shifted the IVFFlat centroids
+def reindex(conn, table_name, column="embedding"):
+    with conn.cursor() as cur:
+        for name in list_indexes(cur, table_name, column):
+            cur.execute(f'REINDEX INDEX "{name}"')
+            logging.info(f"Rebuilt index {name}")
+    conn.commit()
+
+def vector_param(vec):
+    return "[" + ",".join(f"{x:.8g}" for x in np.asarray(vec, dtype="float32")) + "]"
+
+# Query vectors for a text, a list of texts, a vector or a matrix of vectors
+def query_vectors(queries):
+    if isinstance(queries, str):
+        queries = [queries]
+    if len(queries) and isinstance(queries[0], str):
+        return encode(list(queries), QUERY_BATCH_SIZE)
+    return np.atleast_2d(np.asarray(queries, dtype="float32"))
+
+# Equality filters: {"batchreferenceid": 501, "book_key": ["a.pdf", "b.pdf"]}
+def filter_clause(filters):
+    clauses, params = [], []
+    for column, value in (filters or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f't."{column}" = ANY(%s)')
+            params.append(list(value))
+        else:
+            clauses.append(f't."{column}" = %s')
+            params.append(value)
+    return (" AND " + " AND ".join(clauses) if clauses else ""), params
+
+# Per-transaction search parameters: ef_search for HNSW (candidate list size,
+# at least k) and probes for IVFFlat (lists visited); higher means better recall
+def set_search_params(cur, k, ef_search=None, probes=None):
+    ef_search = max(int(ef_search or config.get("vector_ef_search") or DEFAULT_EF_SEARCH), k)
+    probes = int(probes or config.get("vector_probes") or DEFAULT_PROBES)
+    cur.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+    cur.execute("SET LOCAL ivfflat.probes = %s", (probes,))
+
+# Nearest rows to each query, as one list of {id, distance, <columns>} per query.
+# All queries run in one statement: unnest + LATERAL lets each use the ANN index.
+def search_many(queries, k=10, filters=None, table_name="loader_table", id_col="sysdocid",
+                column="embedding", columns=(), metric=None, ef_search=None, probes=None, conn=None):
+    operator, _ = METRICS[get_metric(metric)]
+    vecs = query_vectors(queries)
+    where, params = filter_clause(filters)
+    select = "".join(f', t."{col}"' for col in columns)
+
+    sql = f'''
+        SELECT q.ord, r.*
+        FROM unnest(%s::text[]) WITH ORDINALITY AS q(vec, ord)
+        CROSS JOIN LATERAL (
+            SELECT t."{id_col}" AS id, t."{column}" {operator} q.vec::vector AS distance{select}
+            FROM "{table_name}" AS t
+            WHERE t."{column}" IS NOT NULL{where}
+            ORDER BY t."{column}" {operator} q.vec::vector
+            LIMIT %s
+        ) AS r
+        ORDER BY q.ord, r.distance
+    '''
+    own_conn = conn is None
+    conn = conn or get_connection()
+    try:
+        with conn.cursor() as cur:
+            set_search_params(cur, k, ef_search, probes)
+            cur.execute(sql, [[vector_param(vec) for vec in vecs]] + params + [k])
+            names = [desc[0] for desc in cur.description][1:]
+            rows = cur.fetchall()
+    finally:
+        # Releasing our own connection also ends the transaction the SET LOCALs live in
+        if own_conn:
+            release_connection(conn)
+
+    results = [[] for _ in range(len(vecs))]
+    for row in rows:
+        results[row[0] - 1].append(dict(zip(names, row[1:])))
+    return results
+
+# Nearest rows to a single text or vector
+def search(query, k=10, filters=None, **kwargs):
+    return search_many([query] if isinstance(query, str) else [query], k, filters, **kwargs)[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="pgvector index management and search")
+    sub = parser.add_subparsers(dest="command", required=True)
+    index_cmd = sub.add_parser("index", help="create or rebuild an ANN index")
+    index_cmd.add_argument("--table", default="loader_table")
+    index_cmd.add_argument("--column", default="embedding")
+    index_cmd.add_argument("--method", choices=INDEX_METHODS)
+    index_cmd.add_argument("--reindex", action="store_true")
+    search_cmd = sub.add_parser("search", help="nearest rows to a text")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--table", default="loader_table")
+    search_cmd.add_argument("--id-col", default="sysdocid")
+    search_cmd.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "search":
+        for hit in search(args.query, args.k, table_name=args.table, id_col=args.id_col):
+            print(json.dumps(hit, default=str))
+        return
+
+    conn = get_connection()
+    try:
+        if args.reindex:
+            reindex(conn, args.table, args.column)
+        else:
+            create_index(conn, args.table, args.column, args.method)
+    finally:
+        release_connection(conn)
+
+if __name__ == "__main__":
+    main()
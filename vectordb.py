@@ -1,10 +1,12 @@
-import os
-import psycopg2
-import numpy as np
-import pandas as pd
+import re
+import time
 import logging
 from dotenv import load_dotenv
 from config_paths import config
+from db_connect import get_connection, release_connection
+from vector_io import copy_payload, copy_rows_out, write_vectors
+from pg_export import export_query, vectors_path
+from model_registry import encode
 
 load_dotenv()
 
@@ -14,107 +16,147 @@ logging.basicConfig(
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
-def generate_embeddings():
-    try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            user=os.getenv("DB_USERNAME"),
-            password=os.getenv("DB_PASSWORD"),
-            dbname=os.getenv("DB_NAME")
+# Descriptions per encode call, and how many batches go in one commit
+DEFAULT_BATCH_SIZE = 128
+DEFAULT_COMMIT_EVERY = 10
+
+# Declared dimension of a vector(n) column, or None for an unsized vector column
+def get_vector_dimension(cur, table_name, column):
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attname = %s
+    """, (table_name, column))
+    row = cur.fetchone()
+    if row is None:
+        raise ValueError(f"Column {table_name}.{column} does not exist")
+    match = re.fullmatch(r"vector\((\d+)\)", row[0])
+    return int(match.group(1)) if match else None
+
+# etl_data rows that have no embedding yet, a page at a time from a server-side cursor
+def iter_rows_to_embed(conn, page_size):
+    with conn.cursor(name="etl_rows_to_embed") as cur:
+        cur.itersize = page_size
+        cur.execute("""
+            SELECT d.SourceDocumentID, d.DataDescription
+            FROM etl_data d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM etl_embeddings e WHERE e.SourceDocumentID = d.SourceDocumentID
+            )
+        """)
+        while True:
+            rows = cur.fetchmany(page_size)
+            if not rows:
+                break
+            yield rows
+
+# Binary-COPYs a batch into the staging table and inserts it in one statement
+def write_batch(cur, rows, embeddings):
+    cur.execute("TRUNCATE etl_embeddings_stage")
+    cur.copy_expert(
+        "COPY etl_embeddings_stage (SourceDocumentID, DataDescription, Embedding) FROM STDIN WITH (FORMAT binary)",
+        copy_payload(
+            [[row[0] for row in rows], [row[1] for row in rows], embeddings],
+            ["int8", "text", "vector"]
         )
-        cur = conn.cursor()
+    )
+    cur.execute("""
+        INSERT INTO etl_embeddings (SourceDocumentID, DataDescription, Embedding)
+        SELECT SourceDocumentID, DataDescription, Embedding FROM etl_embeddings_stage
+        ON CONFLICT (SourceDocumentID) DO NOTHING
+    """)
+
+def generate_embeddings(batch_size=None, commit_every=None):
+    batch_size = int(batch_size or config.get("embed_batch_size") or DEFAULT_BATCH_SIZE)
+    commit_every = int(commit_every or config.get("embed_commit_every") or DEFAULT_COMMIT_EVERY)
+
+    try:
+        conn = get_connection()
         logging.info("Successfully connected to PostgreSQL.")
     except Exception as e:
         logging.error("Database connection failed.", exc_info=True)
         return
 
+    read_conn = None
     try:
-        cur.execute("SELECT SourceDocumentID, DataDescription FROM etl_data")
-        rows = cur.fetchall()
-    except Exception as e:
-        logging.error("Failed to fetch data from etl_data.", exc_info=True)
-        cur.close()
-        conn.close()
-        return
-
-    if not rows:
-        logging.warning("No rows found in etl_data table.")
-        cur.close()
-        conn.close()
-        return
-
-    logging.info(f"Generating embeddings for {len(rows)} rows...")
-
-    for source_doc_id, description in rows:
-        try:
-            description = description or ""
-            embedding = np.random.rand(1536).tolist()
-            vector_str = "[" + ",".join(map(str, embedding)) + "]"
-
+        # The server-side cursor reads on its own connection, so commits do not close it
+        read_conn = get_connection()
+        with conn.cursor() as cur:
+            dimension = get_vector_dimension(cur, "etl_embeddings", "embedding")
             cur.execute("""
-                INSERT INTO etl_embeddings (SourceDocumentID, DataDescription, Embedding)
-                VALUES (%s, %s, %s::vector)
-                ON CONFLICT (SourceDocumentID) DO NOTHING
-            """, (source_doc_id, description, vector_str))
-
-            logging.info(f"Inserted embedding for SourceDocumentID {source_doc_id}")
-
-        except Exception as e:
-            logging.error(f"Failed to insert embedding for SourceDocumentID {source_doc_id}", exc_info=True)
-            continue
-
-    try:
+                CREATE TEMP TABLE IF NOT EXISTS etl_embeddings_stage (
+                    SourceDocumentID bigint, DataDescription text, Embedding vector
+                )
+            """)
         conn.commit()
-        logging.info("All embeddings committed successfully.")
-    except Exception as e:
-        logging.error("Failed to commit transaction.", exc_info=True)
 
-    cur.close()
-    conn.close()
-    logging.info("Database connection closed.")
+        done = 0
+        pending = 0
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            for rows in iter_rows_to_embed(read_conn, batch_size):
+                embeddings = encode([row[1] or "" for row in rows], batch_size)
+                if dimension is not None and embeddings.shape[1] != dimension:
+                    raise ValueError(
+                        f"Model produces {embeddings.shape[1]}-dimension embeddings but "
+                        f"etl_embeddings.embedding is vector({dimension})"
+                    )
+                write_batch(cur, rows, embeddings)
+                pending += len(rows)
+
+                if pending >= batch_size * commit_every:
+                    conn.commit()
+                    done += pending
+                    pending = 0
+                    logging.info(f"Committed {done} embeddings ({done / max(time.perf_counter() - start, 1e-9):.0f} rows/sec)")
+        conn.commit()
+        done += pending
 
+        if not done:
+            logging.warning("No rows in etl_data need embeddings.")
+            return
+        elapsed = time.perf_counter() - start
+        logging.info(f"Inserted {done} embeddings in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.0f} rows/sec).")
+    except Exception as e:
+        # Uncommitted batches are picked up again by the next run
+        conn.rollback()
+        logging.error("Failed to generate embeddings.", exc_info=True)
+        raise
+    finally:
+        if read_conn:
+            release_connection(read_conn)
+        release_connection(conn)
+        logging.info("Database connection closed.")
+
+# Streams (SourceDocumentID, DataDescription) to output_file with COPY (CSV, .csv.gz or
+# Parquet) and the embeddings through a binary COPY to a float32 .npy beside it
 def embeddings_to_csv(output_file="etl_embeddings.csv"):
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            user=os.getenv("DB_USERNAME"),
-            password=os.getenv("DB_PASSWORD"),
-            dbname=os.getenv("DB_NAME")
-        )
+        conn = get_connection()
         cur = conn.cursor()
         logging.info("Connected to PostgreSQL for export.")
     except Exception as e:
         logging.error("Failed to connect to DB.", exc_info=True)
         return
 
+    vectors_file = vectors_path(output_file)
     try:
-        cur.execute("SELECT SourceDocumentID, DataDescription, Embedding FROM etl_embeddings")
-        rows = cur.fetchall()
-        logging.info(f"Fetched {len(rows)} rows from etl_embeddings.")
+        rows = export_query(
+            cur,
+            'SELECT SourceDocumentID AS "SourceDocumentID", DataDescription AS "DataDescription" FROM etl_embeddings',
+            output_file
+        )
+        logging.info(f"Exported {rows} rows from etl_embeddings to {output_file}")
+        count = write_vectors(copy_rows_out(
+            cur,
+            "SELECT SourceDocumentID::text, Embedding FROM etl_embeddings WHERE Embedding IS NOT NULL",
+            ["text", "vector"]
+        ), vectors_file)
+        logging.info(f"Exported {count} vectors to {vectors_file}")
     except Exception as e:
-        logging.error("Failed to fetch data from etl_embeddings.", exc_info=True)
+        logging.error("Failed to export etl_embeddings.", exc_info=True)
+    finally:
         cur.close()
-        conn.close()
-        return
-
-    # Prepare DataFrame (keep embedding as single string column)
-    data = []
-    for row in rows:
-        source_id, description, embedding = row
-        data.append({
-            "SourceDocumentID": source_id,
-            "DataDescription": description,
-            "Embedding": str(embedding)
-        })
-
-    df = pd.DataFrame(data)
-    df.to_csv(output_file, index=False)
-    logging.info(f"Exported embeddings to {output_file}")
-
-    cur.close()
-    conn.close()
+        release_connection(conn)
 
 if __name__ == "__main__":
     generate_embeddings()